@@ -2,9 +2,10 @@
 # This script provides detailed error analysis, including confusion matrix, F1 score,
 # accuracy, precision, and recall for each column and for all columns combined.
 
-import openpyxl
 import numpy as np
-from sklearn.metrics import confusion_matrix, precision_score, recall_score, f1_score, accuracy_score
+import pandas as pd
+import highlights
+import instrument
 
 def get_highlight_matrix(excel_file, sheet_name=None):
     """
@@ -16,16 +17,7 @@ def get_highlight_matrix(excel_file, sheet_name=None):
     Returns:
         np.ndarray: 2D array of binary highlight values.
     """
-    wb = openpyxl.load_workbook(excel_file, data_only=True)
-    ws = wb[sheet_name] if sheet_name else wb.active
-    matrix = []
-    for row in ws.iter_rows():
-        # Ignore the first column
-        matrix.append([
-            1 if cell.fill and cell.fill.start_color and cell.fill.start_color.rgb != "00000000" and cell.fill.fill_type else 0
-            for cell in row[1:]
-        ])
-    return np.array(matrix)
+    return highlights.get_highlight_matrix(excel_file, sheet_name).astype(int)
 
 def compare_excel_highlights(file1, file2, sheet1=None, sheet2=None):
     """
@@ -36,57 +28,112 @@ def compare_excel_highlights(file1, file2, sheet1=None, sheet2=None):
         sheet1, sheet2 (str, optional): Sheet names for each file.
     Prints:
         Confusion matrix, accuracy, precision, recall, F1 score for each column and overall.
+    Returns:
+        pd.DataFrame: Per-column and overall metrics table (see highlight_metrics).
     """
     arr1 = get_highlight_matrix(file1, sheet1)
     arr2 = get_highlight_matrix(file2, sheet2)
+    return print_highlight_metrics(arr1, arr2)
+
+@instrument.instrumented("highlight_metrics")
+def highlight_metrics(arr1, arr2, block_rows=highlights.BLOCK_ROWS):
+    """
+    Computes confusion counts and metrics for every column at once.
+
+    TP/FP/FN/TN are obtained with NumPy reductions over the two boolean
+    matrices, `block_rows` rows at a time, so memory-mapped matrices (see
+    highlights.cached_highlight_matrix) are never loaded whole; all metrics are
+    derived from the counts (0 where undefined, like sklearn's zero_division=0).
+    Args:
+        arr1 (np.ndarray): Ground truth highlight matrix (0/1 or bool).
+        arr2 (np.ndarray): Model output highlight matrix (0/1 or bool).
+        block_rows (int): Rows reduced per block.
+    Returns:
+        pd.DataFrame: One row per column (numbered from 1) plus an "All" row, with
+        columns tp, fp, fn, tn, accuracy, misclassification, precision, recall, f1.
+        Use .to_json() / .to_csv() for a machine-readable report.
+    """
+    arr1 = np.asarray(arr1)
+    arr2 = np.asarray(arr2)
     if arr1.shape != arr2.shape:
         raise ValueError("Excel sheets have different shapes after ignoring the first column.")
-    flat1 = arr1.flatten()
-    flat2 = arr2.flatten()
-    if not (set(flat1) <= {0, 1} and set(flat2) <= {0, 1}):
+    width = arr1.shape[1] if arr1.ndim == 2 else 0
+    tp, fp, fn = (np.zeros(width, dtype=np.int64) for _ in range(3))
+    for start in range(0, len(arr1), block_rows):
+        actual = _binary_block(arr1[start:start + block_rows])
+        predicted = _binary_block(arr2[start:start + block_rows])
+        tp += (actual & predicted).sum(axis=0)
+        fp += (~actual & predicted).sum(axis=0)
+        fn += (actual & ~predicted).sum(axis=0)
+    counts = pd.DataFrame(
+        {'tp': tp, 'fp': fp, 'fn': fn, 'tn': len(arr1) - tp - fp - fn},
+        index=pd.RangeIndex(1, width + 1, name='column'),
+    )
+    counts.loc['All'] = counts.sum()
+    return metrics_from_counts(counts)
+
+def _binary_block(block):
+    if block.dtype != bool and not np.isin(block, (0, 1)).all():
         raise ValueError("Both files must contain only binary highlight values (0 or 1).")
+    return block.astype(bool, copy=False)
+
+def metrics_from_counts(counts):
+    """
+    Derives accuracy, misclassification, precision, recall and F1 from confusion counts.
+    Args:
+        counts (pd.DataFrame): Columns tp, fp, fn, tn; one row per column, file, etc.
+    Returns:
+        pd.DataFrame: counts with the metric columns added (0 where undefined).
+    """
+    tp, fp, fn, tn = (counts[k].to_numpy(dtype=float) for k in ('tp', 'fp', 'fn', 'tn'))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        accuracy = (tp + tn) / (tp + fp + fn + tn)
+        return counts.assign(
+            accuracy=np.nan_to_num(accuracy),
+            misclassification=np.nan_to_num(1 - accuracy),
+            precision=np.nan_to_num(tp / (tp + fp)),
+            recall=np.nan_to_num(tp / (tp + fn)),
+            f1=np.nan_to_num(2 * tp / (2 * tp + fp + fn)),
+        )
+
+def print_metrics_row(row):
+    """
+    Prints the confusion matrix and metrics of one metrics table row (from itertuples).
+    """
+    print("Confusion Matrix (Predicted ↓ / Actual →):")
+    print(f"             Actual 0    Actual 1")
+    print(f"Pred 0    |   {row.tn:6}    |   {row.fn:6}   |  <-- True Neg, False Neg")
+    print(f"Pred 1    |   {row.fp:6}    |   {row.tp:6}   |  <-- False Pos, True Pos")
+    print(f"Accuracy:           {row.accuracy*100:.2f}%")
+    print(f"Misclassification:  {row.misclassification*100:.2f}%")
+    print(f"Precision:          {row.precision*100:.2f}%")
+    print(f"Recall:             {row.recall*100:.2f}%")
+    print(f"F1 Score:           {row.f1*100:.2f}%")
+
+def print_highlight_metrics(arr1, arr2):
+    """
+    Prints per-column and overall metrics for two highlight matrices.
+    Args:
+        arr1 (np.ndarray): Ground truth highlight matrix.
+        arr2 (np.ndarray): Model output highlight matrix.
+    Prints:
+        Confusion matrix, accuracy, precision, recall, F1 score for each column and overall.
+    Returns:
+        pd.DataFrame: The metrics table from highlight_metrics.
+    """
+    table = highlight_metrics(arr1, arr2)
+    rows = list(table.itertuples())
 
     # Per-column metrics
     print("\n--- Per-Column Metrics ---")
-    for col in range(arr1.shape[1]):
-        col1 = arr1[:, col]
-        col2 = arr2[:, col]
-        cm = confusion_matrix(col1, col2, labels=[0,1])
-        precision = precision_score(col1, col2, zero_division=0)
-        recall = recall_score(col1, col2, zero_division=0)
-        f1 = f1_score(col1, col2, zero_division=0)
-        accuracy = accuracy_score(col1, col2)
-        misclassification = 1 - accuracy
-        tn, fp, fn, tp = cm.ravel()
-        print(f"\nColumn {col+1}:")
-        print("Confusion Matrix (Predicted ↓ / Actual →):")
-        print(f"             Actual 0    Actual 1")
-        print(f"Pred 0    |   {tn:6}    |   {fn:6}   |  <-- True Neg, False Neg")
-        print(f"Pred 1    |   {fp:6}    |   {tp:6}   |  <-- False Pos, True Pos")
-        print(f"Accuracy:           {accuracy*100:.2f}%")
-        print(f"Misclassification:  {misclassification*100:.2f}%")
-        print(f"Precision:          {precision*100:.2f}%")
-        print(f"Recall:             {recall*100:.2f}%")
-        print(f"F1 Score:           {f1*100:.2f}%")
+    for row in rows[:-1]:
+        print(f"\nColumn {row.Index}:")
+        print_metrics_row(row)
 
     # Combined metrics
     print("\n--- Combined Metrics (All Columns) ---")
-    cm = confusion_matrix(flat1, flat2, labels=[0,1])
-    precision = precision_score(flat1, flat2, zero_division=0)
-    recall = recall_score(flat1, flat2, zero_division=0)
-    f1 = f1_score(flat1, flat2, zero_division=0)
-    accuracy = accuracy_score(flat1, flat2)
-    misclassification = 1 - accuracy
-    tn, fp, fn, tp = cm.ravel()
-    print("Confusion Matrix (Predicted ↓ / Actual →):")
-    print(f"             Actual 0    Actual 1")
-    print(f"Pred 0    |   {tn:6}    |   {fn:6}   |  <-- True Neg, False Neg")
-    print(f"Pred 1    |   {fp:6}    |   {tp:6}   |  <-- False Pos, True Pos")
-    print(f"Accuracy:           {accuracy*100:.2f}%")
-    print(f"Misclassification:  {misclassification*100:.2f}%")
-    print(f"Precision:          {precision*100:.2f}%")
-    print(f"Recall:             {recall*100:.2f}%")
-    print(f"F1 Score:           {f1*100:.2f}%")
+    print_metrics_row(rows[-1])
+    return table
 
 if __name__ == "__main__":
     # Usage: Enter the file name (without extension) for which you want to compare model output
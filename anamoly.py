@@ -6,18 +6,26 @@
 # accuracy, precision, and recall for each column and for all columns combined.
 # It also generates a separate file with missed (red), identified (green), and overpredicted (yellow) cells.
 
+# scikit-learn, joblib, openpyxl and evaluation are imported inside the stages that use
+# them, so short jobs and --rules-only runs (which never import scikit-learn) start quickly.
+
+import argparse
+import copy
 import pandas as pd
 import numpy as np
-from sklearn.ensemble import IsolationForest
-from openpyxl import load_workbook
-from openpyxl.styles import PatternFill
+from enum import IntEnum
+from statistics import NormalDist
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import os
-import accuracy
-import errors
+import instrument
+import masks
+import readers
+from lengths import value_lengths
 
 INPUT= "Train"
 INPUT_FILE = INPUT + ".xlsx"
 OUTPUT_FILE = INPUT + "_output.xlsx"
+RESULT_FILE = INPUT + "_missed_and_identified.xlsx"
 
 # If your input file is in a different directory, set INPUT_FILE to the full path:
 # Example:
@@ -25,186 +33,841 @@ OUTPUT_FILE = INPUT + "_output.xlsx"
 # INPUT_FILE = r"D:/your_folder/Train.xlsx"
 # Otherwise, by default, INPUT_FILE = INPUT + ".xlsx" (in the current directory).
 HIGHLIGHT_COLOR = "FFFF00"
+# Columns with more non-null values than this are type-inferred from a random sample.
+INFER_SAMPLE_SIZE = 10000
+# Confidence required for a sampled type decision; otherwise the full column is parsed.
+INFER_CONFIDENCE = 0.99
+# Output workbook sheet name and number of rows converted per block while streaming it.
+OUTPUT_SHEET_NAME = "Sheet1"
+WRITE_CHUNK_ROWS = 10000
+# Out-of-range rule: flag values beyond the low/high quantiles -/+ MULTIPLIER * (high - low).
+OUT_OF_RANGE_QUANTILES = (0.08, 0.92)
+OUT_OF_RANGE_MULTIPLIER = 13
+# Length-inconsistency rule: only applied when at least this share of values have the mode length.
+LEN_MODE_SHARE = 0.85
+# Optional parse cache: if set, main() caches parsed input sheets (and ground truth highlight
+# matrices) in this directory so unchanged inputs are not re-parsed. Entries are never evicted,
+# and the cached pickles are loaded as trusted data, so only point it at a private directory.
+# Example: READ_CACHE_DIR = ".read_cache"
+READ_CACHE_DIR = None
+# Processes used for per-column type inference and rule evaluation (1 = serial).
+WORKERS = 1
+# Isolation Forest: if set, the forest is fitted on a random sample of at most this many
+# valid rows (its contamination threshold then comes from the sample's scores) instead of
+# on every row. All rows are scored in float32 batches of ISO_BATCH_ROWS.
+# Example: ISO_FIT_SAMPLE_SIZE = 200000
+ISO_FIT_SAMPLE_SIZE = None
+ISO_BATCH_ROWS = 65536
+# Parallel jobs for fitting and scoring the Isolation Forest (None = scikit-learn's default, -1 = all CPUs).
+ISO_N_JOBS = None
+# Fit-once / score-many: if set, the detector is loaded from this file (or fitted on
+# INPUT_FILE and saved there if it does not exist yet) instead of refitting per file.
+# Example: MODEL_FILE = "Train_model.joblib"
+MODEL_FILE = None
+# Skip the Isolation Forest and report rule-based anomalies only (also: --rules-only).
+# MODEL_FILE is not used in this mode.
+RULES_ONLY = False
+# Multi-sheet workbooks: None processes the active sheet only; ALL_SHEETS processes every
+# sheet, and a list of names processes those sheets (also: --sheets all / --sheets "Jan,Feb").
+# The sheets are detected in parallel (see sheets.py) into one output and one report workbook.
+# Example: SHEETS = ALL_SHEETS
+ALL_SHEETS = "all"
+SHEETS = None
+# How rule and Isolation Forest labels are merged (see COMBINE_POLICIES).
+COMBINE_POLICY = "rule_priority"
+# Instrumentation: if set, main() writes per-stage wall/CPU time, rows/cells and memory
+# peaks to PROFILE_REPORT_FILE (JSON) and the cProfile stats of the slowest stage to
+# PROFILE_DUMP_FILE (view with python -m pstats). See instrument.py.
+# Example: PROFILE_REPORT_FILE = "Train_profile.json"; PROFILE_DUMP_FILE = "Train_hottest.prof"
+PROFILE_REPORT_FILE = None
+PROFILE_DUMP_FILE = None
+
+class Label(IntEnum):
+    """
+    Compact anomaly label codes. Label matrices are uint8 NumPy arrays aligned
+    positionally with the input DataFrame; 0 (NONE) means the cell is normal.
+    """
+    NONE = 0
+    MISSING = 1
+    TYPE_MISMATCH = 2
+    LEN_INCON = 3
+    OUT_OF_RANGE = 4
+    STATISTICAL_OUTLIER = 5
+
+_RULE_LABEL_NAMES = ['missing', 'type_mismatch', 'len_incon', 'out_of_range']
+# A cell flagged by both a rule and the Isolation Forest under the "union" policy
+# has code STATISTICAL_OUTLIER + rule code (6-9).
+MULTI_LABEL_BASE = Label.STATISTICAL_OUTLIER
+# String form of each label code, indexed by code value.
+LABEL_NAMES = np.array(
+    [''] + _RULE_LABEL_NAMES + ['statistical_outlier']
+    + [name + '+statistical_outlier' for name in _RULE_LABEL_NAMES],
+    dtype=object,
+)
+
+def empty_labels(df):
+    """
+    Allocate an all-normal label matrix for a DataFrame.
+
+    Args:
+        df (pd.DataFrame): Input data.
+
+    Returns:
+        np.ndarray: uint8 matrix of shape df.shape filled with Label.NONE.
+    """
+    return np.zeros(df.shape, dtype=np.uint8)
+
+def decode_labels(codes, df):
+    """
+    Decode a label code matrix into a DataFrame of label strings.
+
+    Args:
+        codes (np.ndarray): uint8 label matrix.
+        df (pd.DataFrame): DataFrame providing the index and columns.
+
+    Returns:
+        pd.DataFrame: DataFrame of anomaly labels ('' if normal).
+    """
+    return pd.DataFrame(LABEL_NAMES[codes], index=df.index, columns=df.columns)
+
+class ColumnCache:
+    """
+    Per-run cache of column coercions. Each column is parsed as numeric and/or
+    datetime at most once and the result is shared by type inference, the rule
+    engine and the Isolation Forest stage.
+
+    Args:
+        df (pd.DataFrame): Input data.
+    """
+    def __init__(self, df):
+        self.df = df
+        self._parsed = {'numeric': {}, 'datetime': {}}
+
+    def parse(self, kind, col):
+        """
+        Return the full column coerced to `kind` ('numeric' or 'datetime'), invalid values as NaN/NaT.
+        """
+        cache = self._parsed[kind]
+        if col not in cache:
+            cache[col] = _coerce(kind, self.df[col])
+        return cache[col]
+
+    def store(self, kind, col, parsed):
+        """
+        Record a coercion computed elsewhere (e.g. in a worker process).
+        """
+        self._parsed[kind][col] = parsed
+
+    def parsed(self, kind):
+        """
+        Return {column: coerced Series} for the columns already parsed as `kind`.
+        """
+        return self._parsed[kind]
+
+    def numeric(self, col):
+        return self.parse('numeric', col)
+
+    def datetime(self, col):
+        return self.parse('datetime', col)
+
+def _coerce(kind, values):
+    if kind == 'numeric':
+        return pd.to_numeric(values, errors='coerce')
+    return pd.to_datetime(values, errors='coerce')
 
-def infer_column_types(df, threshold=0.8):
+def _valid_fraction(cache, kind, col, n, sample, z, bounds):
+    """
+    Fraction of the n non-null values of col that parse as `kind`.
+
+    When a sample is given, the fraction is estimated from it and accepted only if
+    its Wilson confidence interval excludes every decision boundary in `bounds`;
+    otherwise the full column is parsed through the cache.
+    """
+    if sample is not None:
+        m = len(sample)
+        p = _coerce(kind, sample).notnull().sum() / m
+        denom = 1 + z * z / m
+        center = (p + z * z / (2 * m)) / denom
+        half = z / denom * np.sqrt(p * (1 - p) / m + z * z / (4 * m * m))
+        if all(abs(center - b) > half for b in bounds):
+            return p
+    return cache.parse(kind, col).notnull().sum() / n
+
+@instrument.instrumented("infer_column_types")
+def infer_column_types(df, threshold=0.8, cache=None, sample_size=INFER_SAMPLE_SIZE,
+                       confidence=INFER_CONFIDENCE, workers=1):
     """
     Infer column types for a DataFrame: numeric, datetime, categorical, or mixed.
 
+    Columns with more than `sample_size` non-null values are inferred from a random
+    sample (always including the first non-null value, so datetime format inference
+    matches the full column). A sampled decision is only kept when it is
+    significant at `confidence`; borderline columns are parsed in full.
+
     Args:
         df (pd.DataFrame): Input data.
         threshold (float): Proportion threshold for type assignment.
+        cache (ColumnCache, optional): Shared coercion cache; a new one is created if None.
+        sample_size (int, optional): Sample size for large columns. None disables sampling.
+        confidence (float): Confidence level for accepting a sampled decision.
+        workers (int): Number of processes to spread columns over (1 = serial).
+            Full-column parses done in workers are stored back into the cache.
 
     Returns:
         dict: Mapping of column name to inferred type.
     """
-    types = {}
-    for col in df.columns:
-        col_data = df[col].dropna()
-        n = len(col_data)
-        if n == 0:
-            types[col] = 'unknown'
-            continue
-        num_valid = pd.to_numeric(col_data, errors='coerce').notnull().sum()
-        dt_valid = pd.to_datetime(col_data, errors='coerce').notnull().sum()
-        if num_valid / n >= threshold:
-            types[col] = 'numeric'
-        elif dt_valid / n >= threshold:
-            types[col] = 'datetime'
-        elif num_valid / n < (1 - threshold) and dt_valid / n < (1 - threshold):
-            types[col] = 'categorical'
-        else:
-            types[col] = 'mixed'
-    return types
-
-def rule_based_anomalies(df, types):
+    if cache is None:
+        cache = ColumnCache(df)
+    options = (threshold, sample_size, confidence)
+    if workers > 1:
+        tasks = [(df[col].to_numpy(), j, options) for j, col in enumerate(df.columns)]
+        types = {}
+        for col, (col_type, parsed) in zip(df.columns, _map_columns(_infer_task, tasks, workers)):
+            types[col] = col_type
+            for kind, values in parsed.items():
+                cache.store(kind, col, pd.Series(values, index=df.index))
+        return types
+    return {col: _infer_column(df, col, cache, j, *options) for j, col in enumerate(df.columns)}
+
+def _infer_column(df, col, cache, j, threshold, sample_size, confidence):
+    # Sampling is seeded per column position, so results do not depend on workers
+    present = np.flatnonzero(df[col].notnull().to_numpy())
+    n = len(present)
+    if n == 0:
+        return 'unknown'
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    bounds = (threshold, 1 - threshold)
+    sample = None
+    if sample_size and n > sample_size:
+        rng = np.random.default_rng((42, j))
+        rows = rng.choice(present[1:], sample_size - 1, replace=False)
+        sample = df[col].iloc[np.sort(np.append(rows, present[0]))]
+    num_ratio = _valid_fraction(cache, 'numeric', col, n, sample, z, bounds)
+    dt_ratio = None
+    if num_ratio < threshold:
+        dt_ratio = _valid_fraction(cache, 'datetime', col, n, sample, z, bounds)
+    return classify_column(num_ratio, dt_ratio, threshold)
+
+def _infer_task(args):
+    values, j, options = args
+    df = pd.DataFrame({0: values})
+    cache = ColumnCache(df)
+    col_type = _infer_column(df, 0, cache, j, *options)
+    parsed = {kind: cache.parsed(kind)[0].to_numpy() for kind in ('numeric', 'datetime') if 0 in cache.parsed(kind)}
+    return col_type, parsed
+
+def _map_columns(task, tasks, workers):
+    """
+    Run `task` over per-column `tasks` in a process pool, returning results in column order.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(task, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+
+def classify_column(num_ratio, dt_ratio, threshold=0.8):
+    """
+    Map the numeric and datetime parse rates of a column's non-null values to a type.
+
+    Args:
+        num_ratio (float): Fraction of values that parse as numbers.
+        dt_ratio (float): Fraction of values that parse as datetimes (unused if numeric).
+        threshold (float): Proportion threshold for type assignment.
+
+    Returns:
+        str: 'numeric', 'datetime', 'categorical' or 'mixed'.
+    """
+    if num_ratio >= threshold:
+        return 'numeric'
+    if dt_ratio >= threshold:
+        return 'datetime'
+    if num_ratio < (1 - threshold) and dt_ratio < (1 - threshold):
+        return 'categorical'
+    return 'mixed'
+
+def range_bounds(q_low, q_high):
+    """
+    Out-of-range limits from the OUT_OF_RANGE_QUANTILES quantiles of a column.
+
+    Returns:
+        tuple: (lower, upper) bounds; NaN bounds flag nothing.
+    """
+    iqr = q_high - q_low
+    return q_low - OUT_OF_RANGE_MULTIPLIER * iqr, q_high + OUT_OF_RANGE_MULTIPLIER * iqr
+
+def mode_length(length_counts):
+    """
+    Mode of a column's value lengths, if it is dominant enough to enforce.
+
+    Args:
+        length_counts (pd.Series): Count of valid values per string length.
+
+    Returns:
+        int or None: Smallest most-frequent length, or None if fewer than
+        LEN_MODE_SHARE of the values have it.
+    """
+    total = length_counts.sum()
+    if total == 0:
+        return None
+    top = length_counts.max()
+    if top / total < LEN_MODE_SHARE:
+        return None
+    return int(length_counts.index[length_counts == top].min())
+
+def numeric_column_stats(coerced, lengths):
+    """
+    Global statistics the numeric rules depend on, computed from a whole column.
+
+    Args:
+        coerced (pd.Series): Column coerced to numeric.
+        lengths (pd.Series): String lengths of the column's valid values.
+
+    Returns:
+        dict: {'mode_length': int or None, 'lower': float, 'upper': float}.
+    """
+    q_low, q_high = (coerced.quantile(q) for q in OUT_OF_RANGE_QUANTILES)
+    lower, upper = range_bounds(q_low, q_high)
+    return {'mode_length': mode_length(lengths.value_counts()), 'lower': lower, 'upper': upper}
+
+@instrument.instrumented("rule_based_anomalies")
+def rule_based_anomalies(df, types, cache=None, stats=None, workers=1):
     """
     Detect missing, type mismatch, out-of-range, and length-inconsistent anomalies using rules.
- performance metrics of model on the dataset   Args:
+
+    Each rule is evaluated as a boolean mask per column; the masks are then
+    merged in one priority-ordered pass (missing > type_mismatch > len_incon > out_of_range).
+
+    Args:
         df (pd.DataFrame): Input data.
         types (dict): Column type mapping.
+        cache (ColumnCache, optional): Shared coercion cache; a new one is created if None.
+        stats (dict, optional): Precomputed numeric_column_stats per numeric column, used
+            when df is only part of the data (e.g. a chunk). Computed from df if None.
+        workers (int): Number of processes to spread columns over (1 = serial).
+            Columns are sent as NumPy arrays together with any cached coercions.
 
     Returns:
-        pd.DataFrame: DataFrame of anomaly labels ('' if normal).
+        np.ndarray: uint8 label matrix (Label codes, Label.NONE if normal).
     """
-    anomalies = pd.DataFrame('', index=df.index, columns=df.columns)
-    anomalies[df.isnull()] = 'missing'
-    for col in df.columns:
-        if types[col] == 'numeric':
-            coerced = pd.to_numeric(df[col], errors='coerce')
-            mask = df[col].notnull() & coerced.isnull()
-            anomalies.loc[mask, col] = 'type_mismatch'
-            # Length inconsistency: flag if less than 85% match mode length
-            valid_mask = (anomalies[col] == '')
-            valid_values = df.loc[valid_mask, col].astype(str)
-            lengths = valid_values.str.len()
-            if not lengths.empty:
-                mode_length = lengths.mode()[0]
-                mode_count = (lengths == mode_length).sum()
-                if mode_count / len(lengths) >= 0.85:
-                    for idx, val in valid_values.items():
-                        if len(val) != mode_length:
-                            anomalies.loc[idx, col] = 'len_incon'
-            # Out-of-range (IQR)
-            col_data = coerced
-            q1 = col_data.quantile(0.08)
-            q3 = col_data.quantile(0.92)
-            iqr = q3 - q1
-            multiplier = 13
-            lower = q1 - multiplier * iqr
-            upper = q3 + multiplier * iqr
-            out_range = (col_data < lower) | (col_data > upper)
-            for idx in df.index:
-                if anomalies.loc[idx, col] == '' and out_range.loc[idx]:
-                    anomalies.loc[idx, col] = 'out_of_range'
-        elif types[col] == 'datetime':
-            coerced = pd.to_datetime(df[col], errors='coerce')
-            mask = df[col].notnull() & coerced.isnull()
-            anomalies.loc[mask, col] = 'type_mismatch'
-        elif types[col] == 'mixed':
-            mask = df[col].notnull()
-            anomalies.loc[mask, col] = 'type_mismatch'
-    return anomalies
+    if cache is None:
+        cache = ColumnCache(df)
+    labels = empty_labels(df)
+    if workers > 1:
+        tasks = [(
+            df[col].to_numpy(),
+            types[col],
+            stats[col] if stats is not None and types[col] == 'numeric' else None,
+            {kind: cache.parsed(kind)[col].to_numpy() for kind in ('numeric', 'datetime') if col in cache.parsed(kind)},
+        ) for col in df.columns]
+        for j, col_labels in enumerate(_map_columns(_rule_task, tasks, workers)):
+            labels[:, j] = col_labels
+    else:
+        for j, col in enumerate(df.columns):
+            with instrument.stage(f"rules[{col}]", rows=len(df), cells=len(df)):
+                labels[:, j] = column_rule_labels(
+                    df, col, types[col], cache, stats[col] if stats is not None and types[col] == 'numeric' else None
+                )
+    return labels
+
+def column_rule_labels(df, col, col_type, cache, col_stats=None):
+    """
+    Apply the rules to a single column.
+
+    Args:
+        df (pd.DataFrame): Input data.
+        col: Column to label.
+        col_type (str): Inferred type of the column.
+        cache (ColumnCache): Coercion cache for df.
+        col_stats (dict, optional): numeric_column_stats for the column; computed from it if None.
+
+    Returns:
+        np.ndarray: uint8 label vector for the column.
+    """
+    n = len(df)
+    missing = df[col].isnull().to_numpy()
+    present = ~missing
+    type_mismatch = np.zeros(n, dtype=bool)
+    len_incon = np.zeros(n, dtype=bool)
+    out_of_range = np.zeros(n, dtype=bool)
+    if col_type == 'numeric':
+        coerced = cache.numeric(col)
+        type_mismatch = present & coerced.isnull().to_numpy()
+        valid_mask = present & ~type_mismatch
+        lengths = value_lengths(df.loc[valid_mask, col])
+        if col_stats is None:
+            col_stats = numeric_column_stats(coerced, lengths)
+        # Length inconsistency: flag if less than 85% match mode length
+        if col_stats['mode_length'] is not None:
+            len_incon[valid_mask] = (lengths != col_stats['mode_length']).to_numpy()
+        # Out-of-range (IQR)
+        out_of_range = ((coerced < col_stats['lower']) | (coerced > col_stats['upper'])).to_numpy()
+    elif col_type == 'datetime':
+        coerced = cache.datetime(col)
+        type_mismatch = present & coerced.isnull().to_numpy()
+    elif col_type == 'mixed':
+        type_mismatch = present
+    return np.select(
+        [missing, type_mismatch, len_incon, out_of_range],
+        [Label.MISSING, Label.TYPE_MISMATCH, Label.LEN_INCON, Label.OUT_OF_RANGE],
+        default=Label.NONE,
+    ).astype(np.uint8)
+
+def _rule_task(args):
+    values, col_type, col_stats, parsed = args
+    df = pd.DataFrame({0: values})
+    cache = ColumnCache(df)
+    for kind, coerced in parsed.items():
+        cache.store(kind, 0, pd.Series(coerced))
+    return column_rule_labels(df, 0, col_type, cache, col_stats)
 
-def isolation_forest_anomalies(df, types, contamination=0.001):
+@instrument.instrumented("isolation_forest_anomalies")
+def isolation_forest_anomalies(df, types, contamination=0.001, cache=None, model=None, n_jobs=None,
+                               fit_sample_size=ISO_FIT_SAMPLE_SIZE, batch_rows=ISO_BATCH_ROWS):
     """
     Isolation Forest-based anomaly detection for numeric columns.
 
+    Without a model, a new Isolation Forest is fitted on df itself. With a model
+    from fit_model/load_model, its forest only scores df (no refit) on the
+    numeric columns it was trained on.
+
+    Args:
+        df (pd.DataFrame): Input data.
+        types (dict): Column type mapping.
+        contamination (float): Proportion of anomalies to expect (ignored with a model).
+        cache (ColumnCache, optional): Shared coercion cache; a new one is created if None.
+        model (dict, optional): Pre-fitted model from fit_model/load_model.
+        n_jobs (int, optional): Parallel jobs for fitting/scoring the forest.
+        fit_sample_size (int, optional): Fit on a random sample of at most this many
+            valid rows. None fits on all of them.
+        batch_rows (int): Rows scored per batch.
+
+    Returns:
+        np.ndarray: uint8 label matrix (Label codes, Label.NONE if normal).
+    """
+    if cache is None:
+        cache = ColumnCache(df)
+    anomalies = empty_labels(df)
+    if model is not None:
+        num_cols = model['num_cols']
+        _check_schema(df, model)
+    else:
+        num_cols = [col for col in df.columns if types[col] == 'numeric']
+    if num_cols and (model is not None or len(df) > 10):
+        valid_mask, X = _numeric_matrix(df, num_cols, cache)
+        if valid_mask.any():
+            if model is None:
+                iso = _fit_forest(X, valid_mask, contamination, n_jobs, fit_sample_size)
+            else:
+                iso = model['iso']
+                if n_jobs is not None:
+                    # A shallow copy shares the fitted trees but leaves the model's own n_jobs alone
+                    iso = copy.copy(iso).set_params(n_jobs=n_jobs)
+            outlier_rows = _forest_outliers(iso, X, valid_mask, num_cols, batch_rows)
+            num_idx = [df.columns.get_loc(col) for col in num_cols]
+            anomalies[np.ix_(outlier_rows, num_idx)] = Label.STATISTICAL_OUTLIER
+    return anomalies
+
+def _numeric_matrix(df, num_cols, cache):
+    # One contiguous float32 array (the precision the forest works in) instead of a frame copy
+    X = np.empty((len(df), len(num_cols)), dtype=np.float32)
+    for j, col in enumerate(num_cols):
+        X[:, j] = cache.numeric(col).to_numpy(dtype=np.float64, na_value=np.nan)
+    # Only use rows where all numeric columns are valid numbers
+    valid_mask = ~np.isnan(X).any(axis=1)
+    return valid_mask, X
+
+def _fit_forest(X, valid_mask, contamination, n_jobs, fit_sample_size):
+    from sklearn.ensemble import IsolationForest
+    rows = np.flatnonzero(valid_mask)
+    if fit_sample_size is not None and len(rows) > fit_sample_size:
+        rows = np.sort(np.random.default_rng(42).choice(rows, fit_sample_size, replace=False))
+    # The contamination threshold (offset_) is the percentile of the fitted rows' scores
+    with instrument.stage("isolation_forest.fit", rows=len(rows), cells=len(rows) * X.shape[1]):
+        return IsolationForest(contamination=contamination, random_state=42, n_jobs=n_jobs).fit(X[rows])
+
+def _forest_outliers(iso, X, valid_mask, num_cols, batch_rows):
+    # Forests fitted on a DataFrame by earlier versions expect feature names
+    named = hasattr(iso, 'feature_names_in_')
+    outliers = []
+    n_valid = int(valid_mask.sum())
+    with instrument.stage("isolation_forest.score", rows=n_valid, cells=n_valid * X.shape[1]):
+        for start in range(0, len(X), batch_rows):
+            rows = start + np.flatnonzero(valid_mask[start:start + batch_rows])
+            if len(rows) == 0:
+                continue
+            batch = pd.DataFrame(X[rows], columns=num_cols) if named else X[rows]
+            outliers.append(rows[iso.predict(batch) == -1])
+    return np.concatenate(outliers) if outliers else np.empty(0, dtype=np.intp)
+
+def rule_stats(df, types, cache=None):
+    """
+    Compute numeric_column_stats for every numeric column of df.
+
     Args:
         df (pd.DataFrame): Input data.
         types (dict): Column type mapping.
+        cache (ColumnCache, optional): Shared coercion cache; a new one is created if None.
+
+    Returns:
+        dict: Column name -> stats, as accepted by rule_based_anomalies(stats=...).
+    """
+    if cache is None:
+        cache = ColumnCache(df)
+    stats = {}
+    for col in df.columns:
+        if types[col] == 'numeric':
+            coerced = cache.numeric(col)
+            valid_mask = df[col].notnull().to_numpy() & coerced.notnull().to_numpy()
+            stats[col] = numeric_column_stats(coerced, value_lengths(df.loc[valid_mask, col]))
+    return stats
+
+@instrument.instrumented("fit_model")
+def fit_model(df, types, contamination=0.001, cache=None, n_jobs=None, fit_sample_size=ISO_FIT_SAMPLE_SIZE):
+    """
+    Fit the detector on a reference DataFrame (e.g. Train.xlsx) for later scoring.
+
+    Args:
+        df (pd.DataFrame): Reference data.
+        types (dict): Column type mapping.
         contamination (float): Proportion of anomalies to expect.
+        cache (ColumnCache, optional): Shared coercion cache; a new one is created if None.
+        n_jobs (int, optional): Parallel jobs for fitting the forest.
+        fit_sample_size (int, optional): Fit on a random sample of at most this many
+            valid rows. None fits on all of them.
 
     Returns:
-        pd.DataFrame: DataFrame of anomaly labels ('' if normal).
+        dict: Model with keys 'iso' (fitted IsolationForest, or None if there was
+        nothing to fit), 'columns', 'types', 'num_cols' and 'stats' (rule_stats).
     """
-    anomalies = pd.DataFrame('', index=df.index, columns=df.columns)
+    if cache is None:
+        cache = ColumnCache(df)
     num_cols = [col for col in df.columns if types[col] == 'numeric']
-    if num_cols and len(df) > 10:
-        # Only use rows where all numeric columns are valid numbers
-        valid_mask = pd.DataFrame({
-            col: pd.to_numeric(df[col], errors='coerce').notnull()
-            for col in num_cols
-        }).all(axis=1)
-        X = df.loc[valid_mask, num_cols].apply(pd.to_numeric, errors='coerce')
-        if not X.empty:
-            iso = IsolationForest(contamination=contamination, random_state=42)
-            preds = iso.fit_predict(X)
-            outlier_rows = X.index[preds == -1]
-            for row in outlier_rows:
-                for col in num_cols:
-                    # Only mark as statistical_outlier if not already missing/type_mismatch/out_of_range
-                    if anomalies.loc[row, col] == '':
-                        anomalies.loc[row, col] = 'statistical_outlier'
-    return anomalies
+    iso = None
+    if num_cols:
+        valid_mask, X = _numeric_matrix(df, num_cols, cache)
+        if valid_mask.any():
+            iso = _fit_forest(X, valid_mask, contamination, n_jobs, fit_sample_size)
+    return {
+        'iso': iso,
+        'columns': list(df.columns),
+        'types': dict(types),
+        'num_cols': num_cols if iso is not None else [],
+        'stats': rule_stats(df, types, cache),
+    }
+
+def _check_schema(df, model):
+    missing = [col for col in model['columns'] if col not in df.columns]
+    if missing:
+        raise ValueError(f"Input is missing columns the model was fitted on: {missing}")
+
+def save_model(model, path):
+    """
+    Save a model from fit_model to disk.
+    """
+    import joblib
+    joblib.dump(model, path)
+
+@instrument.instrumented("load_model")
+def load_model(path):
+    """
+    Load a model saved with save_model.
+    """
+    import joblib
+    return joblib.load(path)
 
-def combine_anomalies(rule_anom, iso_anom):
+def _rule_priority(rule_anom, iso_anom):
+    return np.where(rule_anom != Label.NONE, rule_anom, iso_anom)
+
+def _detector_priority(rule_anom, iso_anom):
+    return np.where(iso_anom != Label.NONE, iso_anom, rule_anom)
+
+def _union(rule_anom, iso_anom):
+    both = (rule_anom != Label.NONE) & (iso_anom != Label.NONE)
+    return np.where(both, MULTI_LABEL_BASE + rule_anom, _rule_priority(rule_anom, iso_anom))
+
+# Policy name -> function(rule_anom, iso_anom) returning the combined code matrix.
+#   rule_priority:     a rule label wins over the forest's (the original behaviour)
+#   detector_priority: the forest's label wins over a rule label
+#   union:             cells flagged by both keep both labels (see MULTI_LABEL_BASE)
+COMBINE_POLICIES = {
+    "rule_priority": _rule_priority,
+    "detector_priority": _detector_priority,
+    "union": _union,
+}
+
+@instrument.instrumented("combine_anomalies")
+def combine_anomalies(rule_anom, iso_anom, policy=COMBINE_POLICY):
     """
-    Combine rule-based and isolation forest anomalies, prioritizing rule-based results.
+    Combine rule-based and isolation forest anomalies with one whole-matrix NumPy pass.
 
     Args:
-        rule_anom (pd.DataFrame): Rule-based anomaly DataFrame.
-        iso_anom (pd.DataFrame): Isolation Forest anomaly DataFrame.
+        rule_anom (np.ndarray): Rule-based label matrix.
+        iso_anom (np.ndarray): Isolation Forest label matrix.
+        policy (str): Name of a COMBINE_POLICIES entry. Defaults to prioritizing
+            rule-based results.
 
     Returns:
-        pd.DataFrame: Combined anomaly DataFrame.
+        np.ndarray: Combined label matrix.
     """
-    combined = rule_anom.copy()
-    for col in iso_anom.columns:
-        for idx in iso_anom.index:
-            if not combined.loc[idx, col] and iso_anom.loc[idx, col]:
-                combined.loc[idx, col] = iso_anom.loc[idx, col]
-    return combined
+    if policy not in COMBINE_POLICIES:
+        raise ValueError(f"Unknown combine policy {policy!r}; expected one of {sorted(COMBINE_POLICIES)}")
+    return COMBINE_POLICIES[policy](rule_anom, iso_anom).astype(np.uint8)
 
-def replace_and_highlight(df, anomalies, output_file):
+@instrument.instrumented("replace_and_highlight")
+def replace_and_highlight(df, anomalies, output_file, chunk_rows=WRITE_CHUNK_ROWS):
     """
     Replace anomalous cells with error label and highlight them in the Excel output.
 
+    The workbook is written in a single streaming pass (openpyxl write-only mode)
+    and is never reloaded.
+
     Args:
         df (pd.DataFrame): Original data.
-        anomalies (pd.DataFrame): Anomaly labels.
+        anomalies (np.ndarray): uint8 label matrix.
         output_file (str): Path to output Excel file.
+        chunk_rows (int): Number of rows converted per block.
     """
-    df_out = df.copy()
-    for col in df.columns:
-        for idx in df.index:
-            if anomalies.loc[idx, col]:
-                df_out.loc[idx, col] = anomalies.loc[idx, col]
-    df_out.to_excel(output_file, index=False)
-    wb = load_workbook(output_file)
-    ws = wb.active
-    fill = PatternFill(start_color=HIGHLIGHT_COLOR, end_color=HIGHLIGHT_COLOR, fill_type="solid")
-    for i, col in enumerate(df.columns, 1):
-        for j, idx in enumerate(df.index, 2):
-            if anomalies.loc[idx, col]:
-                ws.cell(row=j, column=i).fill = fill
+    replace_and_highlight_sheets({OUTPUT_SHEET_NAME: df}, {OUTPUT_SHEET_NAME: anomalies}, output_file, chunk_rows)
+
+def replace_and_highlight_sheets(frames, anomalies, output_file, chunk_rows=WRITE_CHUNK_ROWS):
+    """
+    Write several labelled sheets into one highlighted output workbook
+    (see replace_and_highlight), one output sheet per input sheet.
+
+    Args:
+        frames (dict): Sheet name -> original data.
+        anomalies (dict): Sheet name -> uint8 label matrix.
+        output_file (str): Path to output Excel file.
+        chunk_rows (int): Number of rows converted per block.
+    """
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    fill = highlight_fill()
+    for name, df in frames.items():
+        ws = wb.create_sheet(name)
+        ws.append(header_cells(ws, df.columns))
+        append_highlighted_rows(ws, df, anomalies[name], fill, chunk_rows)
     wb.save(output_file)
 
-def main():
+def write_output(df, anomalies, output_file):
+    """
+    Write the detection output: a highlighted workbook for .xlsx paths (see
+    replace_and_highlight), otherwise a label mask file (see masks.py).
+
+    Args:
+        df (pd.DataFrame): Original data.
+        anomalies (np.ndarray): uint8 label matrix.
+        output_file (str): Path to the output workbook or mask file.
+    """
+    if readers.is_workbook(output_file):
+        replace_and_highlight(df, anomalies, output_file)
+    else:
+        masks.write_mask(anomalies, df.columns, output_file)
+
+def highlight_fill():
+    """
+    Solid HIGHLIGHT_COLOR fill used for anomalous cells.
+    """
+    from openpyxl.styles import PatternFill
+    return PatternFill(start_color=HIGHLIGHT_COLOR, end_color=HIGHLIGHT_COLOR, fill_type="solid")
+
+def header_cells(ws, columns):
+    """
+    Header row for a write-only worksheet, styled like the header df.to_excel
+    writes (bold, thin border, centred at the top).
+
+    Args:
+        ws: openpyxl write-only worksheet.
+        columns: Column names.
+
+    Returns:
+        list: One WriteOnlyCell per column.
+    """
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Alignment, Border, Font, Side
+    font = Font(bold=True)
+    side = Side(style="thin")
+    border = Border(left=side, right=side, top=side, bottom=side)
+    alignment = Alignment(horizontal="center", vertical="top")
+    cells = []
+    for col in columns:
+        cell = WriteOnlyCell(ws, value=col)
+        cell.font, cell.border, cell.alignment = font, border, alignment
+        cells.append(cell)
+    return cells
+
+def append_highlighted_rows(ws, df, anomalies, fill, chunk_rows=WRITE_CHUNK_ROWS):
+    """
+    Append df's rows to a write-only worksheet, replacing anomalous cells with
+    their label and highlighting them.
+
+    Rows are converted `chunk_rows` at a time; flagged cells are emitted as
+    styled WriteOnlyCells that all share `fill`.
+
+    Args:
+        ws: openpyxl write-only worksheet.
+        df (pd.DataFrame): Rows to write.
+        anomalies (np.ndarray): uint8 label matrix aligned with df.
+        fill (PatternFill): Highlight fill.
+        chunk_rows (int): Number of rows converted per block.
+    """
+    from openpyxl.cell import WriteOnlyCell
+    for start in range(0, len(df), chunk_rows):
+        block = df.iloc[start:start + chunk_rows].astype(object)
+        values = block.where(block.notnull(), None).to_numpy()
+        for row_values, row_codes in zip(values, anomalies[start:start + chunk_rows]):
+            row = list(row_values)
+            for i in np.flatnonzero(row_codes):
+                cell = WriteOnlyCell(ws, value=LABEL_NAMES[row_codes[i]])
+                cell.fill = fill
+                row[i] = cell
+            ws.append(row)
+
+def detect_anomalies(df, model=None, cache=None, workers=WORKERS, policy=COMBINE_POLICY, rules_only=False,
+                     n_jobs=None):
+    """
+    Run the detectors on a DataFrame and combine their labels.
+
+    Args:
+        df (pd.DataFrame): Input data.
+        model (dict, optional): Pre-fitted model to score with (see fit_model). Its
+            column types and rule statistics are used; if None, types are inferred
+            and the Isolation Forest is fitted on df itself.
+        cache (ColumnCache, optional): Shared coercion cache; a new one is created if None.
+        workers (int): Processes for type inference and rules.
+        policy (str): How rule and forest labels are merged (see COMBINE_POLICIES).
+        rules_only (bool): Skip the Isolation Forest; scikit-learn is never imported.
+        n_jobs (int, optional): Parallel jobs for fitting/scoring the forest.
+
+    Returns:
+        np.ndarray: uint8 label matrix of shape df.shape.
+    """
+    if cache is None:
+        cache = ColumnCache(df)
+    if model is not None:
+        _check_schema(df, model)
+        types = {col: model['types'].get(col, 'categorical') for col in df.columns}
+    else:
+        types = infer_column_types(df, cache=cache, workers=workers)
+    stats = model['stats'] if model is not None else None
+    rule_anom = rule_based_anomalies(df, types, cache=cache, stats=stats, workers=workers)
+    if rules_only:
+        return rule_anom
+    iso_anom = isolation_forest_anomalies(df, types, cache=cache, model=model, n_jobs=n_jobs)
+    return combine_anomalies(rule_anom, iso_anom, policy)
+
+def detect_file(input_file, output_file, result_file, model=None, model_file=None,
+                workers=WORKERS, read_cache_dir=None, policy=COMBINE_POLICY, rules_only=False,
+                verbose=True, truth_file=None, n_jobs=None):
+    """
+    Run detection and evaluation on one input file.
+
+    Workbooks and the columnar formats (CSV, Parquet, Arrow) can be mixed freely:
+    a columnar output or result path gets a mask file (see masks.py) instead of
+    a highlighted workbook.
+
+    Args:
+        input_file (str): Path to the input Excel, CSV, Parquet or Arrow file.
+        output_file (str): Path to output Excel file or label mask file.
+        result_file (str): Path to the missed/identified/overpredicted Excel file or mask file.
+        model (dict, optional): Pre-fitted model to score with (see fit_model).
+        model_file (str, optional): If no model is given: load it from this file, or
+            fit on input_file and save it there if the file does not exist yet.
+        workers (int): Processes for type inference and rules.
+        read_cache_dir (str, optional): Parsed-sheet cache directory (see readers.read_sheet), off by default; the
+            ground truth highlight matrix is cached there too (see highlights.cached_highlight_matrix).
+        policy (str): How rule and forest labels are merged (see COMBINE_POLICIES).
+        rules_only (bool): Skip the Isolation Forest; scikit-learn is never imported.
+            Cannot be combined with model or model_file.
+        verbose (bool): Print the metrics report.
+        truth_file (str, optional): Ground truth: a highlighted workbook or a mask file.
+            Defaults to input_file if it is a workbook, else its sidecar mask
+            (see masks.mask_path).
+        n_jobs (int, optional): Parallel jobs for fitting/scoring the forest.
+
+    Returns:
+        pd.DataFrame: Per-column and overall metrics (see accuracy.highlight_metrics).
+    """
+    import evaluation
+    if rules_only and (model is not None or model_file):
+        raise ValueError("A rules-only run does not use a model; pass neither model nor model_file.")
+    with instrument.stage("read_sheet") as record:
+        df = readers.read_sheet(input_file, cache_dir=read_cache_dir)
+        record.update(rows=len(df), cells=df.size)
+    cache = ColumnCache(df)
+    if model is None and model_file and os.path.exists(model_file):
+        model = load_model(model_file)
+    if model is None and model_file:
+        model = fit_model(df, infer_column_types(df, cache=cache, workers=workers), cache=cache, n_jobs=n_jobs)
+        save_model(model, model_file)
+    anomalies = detect_anomalies(df, model, cache=cache, workers=workers, policy=policy, rules_only=rules_only,
+                                 n_jobs=n_jobs)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        write = pool.submit(write_output, df, anomalies, output_file)
+        if truth_file is None:
+            truth_file = input_file if readers.is_workbook(input_file) else masks.mask_path(input_file)
+        metrics = evaluation.evaluate_predictions(truth_file, anomalies, result_file, verbose=verbose,
+                                                  cache_dir=read_cache_dir)
+        write.result()
+    return metrics
+
+def parse_sheets(value):
+    """
+    Parse a --sheets argument: "all" for every sheet, or comma-separated sheet names.
+    """
+    if value == ALL_SHEETS:
+        return ALL_SHEETS
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    if not names:
+        raise argparse.ArgumentTypeError('expected "all" or comma-separated sheet names')
+    return names
+
+def _detect_input(model_file, rules_only, sheets):
+    if sheets is None:
+        detect_file(INPUT_FILE, OUTPUT_FILE, RESULT_FILE, model_file=model_file, rules_only=rules_only,
+                    read_cache_dir=READ_CACHE_DIR, n_jobs=ISO_N_JOBS)
+        return
+    import sheets as multi_sheet
+    model = load_model(model_file) if model_file and os.path.exists(model_file) else None
+    multi_sheet.detect_workbook(INPUT_FILE, OUTPUT_FILE, RESULT_FILE, None if sheets == ALL_SHEETS else sheets,
+                                model=model, rules_only=rules_only, read_cache_dir=READ_CACHE_DIR)
+
+def main(rules_only=RULES_ONLY, sheets=SHEETS):
     """
     Main entry point for anomaly detection and evaluation.
 
     - Uses INPUT as the file name (without extension) for the model.
+    - With sheets (ALL_SHEETS or a list of names), processes those sheets of INPUT_FILE in
+      parallel into one output and one report workbook (see sheets.detect_workbook); the
+      per-sheet and combined metrics are printed. MODEL_FILE is used only if it exists.
+    - If MODEL_FILE is set, scores with the saved model (fitting and saving it first if needed).
+    - With rules_only, skips the Isolation Forest (and scikit-learn) entirely.
     - Generates an output Excel file with highlighted anomalies.
-    - Prints accuracy and error analysis (missed, overpredicted, identified) by calling accuracy.py.
-    - Compares highlights between input and output files by calling errors.py.
+    - Prints accuracy and error analysis (missed, overpredicted, identified) by calling evaluation.py.
+      Predictions are evaluated from memory while the output file is written in a background thread.
+    - If PROFILE_REPORT_FILE / PROFILE_DUMP_FILE are set, saves per-stage timings / a cProfile dump.
     """
     if not os.path.exists(INPUT_FILE):
         print(f"Input file not found: {INPUT_FILE}")
         return
-    df = pd.read_excel(INPUT_FILE)
-    types = infer_column_types(df)
-    rule_anom = rule_based_anomalies(df, types)
-    iso_anom = isolation_forest_anomalies(df, types)
-    anomalies = combine_anomalies(rule_anom, iso_anom)
-    replace_and_highlight(df, anomalies, OUTPUT_FILE)
+    model_file = None if rules_only else MODEL_FILE
+    if not (PROFILE_REPORT_FILE or PROFILE_DUMP_FILE):
+        _detect_input(model_file, rules_only, sheets)
+    else:
+        with instrument.Recorder(profile=PROFILE_DUMP_FILE is not None) as recorder:
+            _detect_input(model_file, rules_only, sheets)
+        if PROFILE_REPORT_FILE:
+            recorder.write_json(PROFILE_REPORT_FILE)
+            print(f"Stage timings saved to {PROFILE_REPORT_FILE}")
+        if PROFILE_DUMP_FILE:
+            hottest = recorder.dump_hottest(PROFILE_DUMP_FILE)
+            print(f"cProfile stats of the slowest stage ({hottest}) saved to {PROFILE_DUMP_FILE}")
     print("Done. Please check the output file for highlighted errors.")
 
 if __name__ == "__main__":
-    main()
-    accuracy.compare_excel_highlights(INPUT_FILE, OUTPUT_FILE)
-    errors.create_error_excel_combined(
-        input_f=INPUT_FILE,
-        output_f=OUTPUT_FILE,
-        result_f=INPUT + "_missed_and_identified.xlsx"
-    )
+    parser = argparse.ArgumentParser(description=f"Detect anomalies in {INPUT_FILE} and evaluate them.")
+    parser.add_argument("--rules-only", action="store_true", default=RULES_ONLY,
+                        help="skip the Isolation Forest (scikit-learn is not imported)")
+    parser.add_argument("--sheets", type=parse_sheets, default=SHEETS,
+                        help='process several sheets in parallel: "all" or comma-separated sheet names')
+    args = parser.parse_args()
+    main(rules_only=args.rules_only, sheets=args.sheets)
     print("Anomaly detection and comparison completed.")
\ No newline at end of file
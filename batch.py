@@ -0,0 +1,118 @@
+# batch.py
+# Batch mode: runs anomaly detection and evaluation on every .xlsx file in a
+# directory (or matching a glob pattern) with one invocation. Files are processed
+# concurrently in a process pool forked from this warm interpreter, so pandas and
+# scikit-learn are imported once. Each input gets its usual "_output.xlsx" and
+# "_missed_and_identified.xlsx" files, and an aggregate metrics summary is printed.
+#
+# Usage:
+#   python batch.py incoming/                 # every .xlsx in the directory
+#   python batch.py "incoming/*.xlsx" --workers 8 --model Train_model.joblib
+#   python batch.py incoming/ --rules-only    # no Isolation Forest, scikit-learn is not loaded
+#   python batch.py incoming/ --workers 2 --n-jobs 4   # each file's forest scored with 4 jobs
+
+import argparse
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+import accuracy
+import anamoly
+
+OUTPUT_SUFFIXES = ("_output.xlsx", "_missed_and_identified.xlsx")
+
+_model = None
+_rules_only = False
+_n_jobs = None
+
+def find_inputs(path):
+    """
+    List the input workbooks for a directory or glob pattern, skipping files
+    this tool generates and Excel lock files.
+
+    Args:
+        path (str): Directory, single file or glob pattern.
+
+    Returns:
+        list: Sorted input file paths.
+    """
+    pattern = os.path.join(path, "*.xlsx") if os.path.isdir(path) else path
+    return sorted(
+        f for f in glob.glob(pattern)
+        if not f.endswith(OUTPUT_SUFFIXES) and not os.path.basename(f).startswith("~$")
+    )
+
+def _init_worker(model_file, rules_only=False, n_jobs=None):
+    global _model, _rules_only, _n_jobs
+    _rules_only = rules_only
+    _n_jobs = n_jobs
+    if model_file:
+        _model = anamoly.load_model(model_file)
+
+def process_file(input_file):
+    """
+    Detect and evaluate one file, writing its output files next to it.
+
+    Returns:
+        pd.DataFrame: Its metrics table (see accuracy.highlight_metrics).
+    """
+    base = os.path.splitext(input_file)[0]
+    return anamoly.detect_file(
+        input_file, base + "_output.xlsx", base + "_missed_and_identified.xlsx",
+        model=_model, workers=1, rules_only=_rules_only, verbose=False, n_jobs=_n_jobs,
+    )
+
+def run_batch(path, workers=None, model_file=None, rules_only=False, n_jobs=None):
+    """
+    Process every input file under `path` concurrently.
+
+    Args:
+        path (str): Directory, single file or glob pattern.
+        workers (int, optional): Number of processes. Defaults to the CPU count.
+        model_file (str, optional): Saved model (see anamoly.save_model) to score with.
+        rules_only (bool): Skip the Isolation Forest (see anamoly.detect_file).
+        n_jobs (int, optional): Parallel jobs for fitting/scoring each file's forest.
+
+    Returns:
+        pd.DataFrame: Overall confusion counts and metrics per file, plus an "All" row.
+    """
+    files = find_inputs(path)
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model_file, rules_only, n_jobs)) as pool:
+        futures = {pool.submit(process_file, f): f for f in files}
+        for future in as_completed(futures):
+            input_file = futures[future]
+            try:
+                results[input_file] = future.result().loc["All"]
+            except Exception as exc:
+                print(f"{input_file}: failed ({exc})")
+                continue
+            row = results[input_file]
+            print(f"{input_file}: precision {row.precision*100:.2f}%  recall {row.recall*100:.2f}%  F1 {row.f1*100:.2f}%")
+    counts = pd.DataFrame(
+        [results[f][["tp", "fp", "fn", "tn"]] for f in files if f in results],
+        index=pd.Index([f for f in files if f in results], name="file"),
+        columns=["tp", "fp", "fn", "tn"],
+    ).astype(int)
+    counts.loc["All"] = counts.sum()
+    return accuracy.metrics_from_counts(counts)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run anomaly detection on many workbooks.")
+    parser.add_argument("path", help="directory of .xlsx files, or a glob pattern")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes (default: CPU count)")
+    parser.add_argument("--model", default=None, help="saved model to score with instead of refitting per file")
+    parser.add_argument("--rules-only", action="store_true", help="skip the Isolation Forest (scikit-learn is not imported)")
+    parser.add_argument("--n-jobs", type=int, default=None,
+                        help="parallel jobs for fitting/scoring each file's Isolation Forest (default: scikit-learn's)")
+    args = parser.parse_args()
+    if args.model and not os.path.exists(args.model):
+        parser.error(f"model file not found: {args.model}")
+    if args.model and args.rules_only:
+        parser.error("--model cannot be combined with --rules-only")
+    summary = run_batch(args.path, args.workers, args.model, args.rules_only, args.n_jobs)
+    print(f"\n--- Aggregate Metrics ({len(summary) - 1} files) ---")
+    accuracy.print_metrics_row(next(summary.loc[["All"]].itertuples()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+# benchmark.py
+# Benchmark harness: generates a synthetic highlighted workbook (see synthetic.py),
+# then times every stage of the pipeline separately on it and records the peak
+# resident memory of the process. Results are written as JSON together with the
+# git commit, so runs can be compared across commits. With --startup it
+# instead measures how long each entry-point module takes to import in a fresh
+# interpreter (python -X importtime), and whether it pulls in scikit-learn.
+#
+# Usage:
+#   python benchmark.py --rows 100000 --output bench_new.json
+#   python benchmark.py --rows 100000 --output bench_new.json --compare bench_old.json
+#   python benchmark.py --startup
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+import sklearn
+import openpyxl
+import accuracy
+import anamoly
+import errors
+import readers
+import synthetic
+
+# Modules whose import time --startup measures.
+STARTUP_MODULES = ("anamoly", "accuracy", "errors", "evaluation", "chunked", "batch")
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process so far, in MB (None if unavailable).
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / (1 << 10)
+
+def git_commit():
+    """
+    Returns:
+        str or None: Short hash of the checked-out commit, if this is a git checkout.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def import_time(module, repeat=5):
+    """
+    Import `module` in fresh interpreters with python -X importtime.
+
+    Args:
+        module (str): Module to import.
+        repeat (int): Interpreters to start; the fastest import is reported.
+
+    Returns:
+        dict: 'import_ms' (cumulative import time of the module), 'sklearn'
+        (whether scikit-learn was imported) and 'slowest' (the five slowest
+        modules it imported directly, as [name, ms] pairs).
+    """
+    best = None
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True,
+        )
+        # Modules are listed after everything they import; nesting is shown by two
+        # spaces of indentation per level after a single leading space
+        names, direct = [], []
+        for line in proc.stderr.splitlines():
+            if not line.startswith("import time:") or "self [us]" in line:
+                continue
+            _, cumulative, name = line[len("import time:"):].split("|")
+            depth = (len(name) - len(name.lstrip()) - 1) // 2
+            name, ms = name.strip(), int(cumulative) / 1000
+            names.append(name)
+            if depth == 1:
+                direct.append((name, ms))
+            elif depth == 0:
+                if name == module:
+                    break
+                direct = []
+        if best is None or ms < best["import_ms"]:
+            direct.sort(key=lambda entry: -entry[1])
+            best = {
+                "import_ms": ms,
+                "sklearn": "sklearn" in names,
+                "slowest": [[name, ms] for name, ms in direct[:5]],
+            }
+    return best
+
+def run_startup_benchmark(modules=STARTUP_MODULES, repeat=5):
+    """
+    Measure the import time of each entry-point module (see import_time).
+
+    Returns:
+        dict: JSON-serialisable results with the environment and one entry per module.
+    """
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "startup": {module: import_time(module, repeat) for module in modules},
+    }
+
+def print_startup(results, baseline=None):
+    """
+    Print per-module import times, with the ratio to a baseline result (old / new) if given.
+    """
+    print(f"commit {results['commit']}  import times (best of several fresh interpreters)")
+    for module, entry in results["startup"].items():
+        line = f"{module:12} {entry['import_ms']:8.1f} ms  sklearn {'yes' if entry['sklearn'] else 'no '}"
+        old = (baseline or {}).get("startup", {}).get(module)
+        if old:
+            line += f"  x{old['import_ms'] / entry['import_ms']:.2f} vs {baseline['commit']}"
+        print(line)
+        for name, ms in entry["slowest"]:
+            print(f"    {name:30} {ms:8.1f} ms")
+
+def _run_stage(stages, name, func, repeat):
+    # Best wall time of `repeat` runs; the result of the last run is returned
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    stages[name] = {"seconds": min(times), "peak_rss_mb": peak_rss_mb()}
+    return result
+
+def run_benchmark(rows, mix=None, anomaly_rate=synthetic.DEFAULT_ANOMALY_RATE, seed=42, repeat=1, workdir=None):
+    """
+    Time each pipeline stage on a synthetic sheet.
+
+    Every stage runs on its own (with its own coercion cache), so its time
+    includes any parsing it needs.
+
+    Args:
+        rows (int): Number of data rows.
+        mix (dict, optional): Column kinds and counts (see synthetic.make_sheet).
+        anomaly_rate (float): Share of injected anomalous cells.
+        seed (int): Seed of the generated sheet.
+        repeat (int): Runs per stage; the fastest is reported.
+        workdir (str, optional): Directory for the generated workbooks. A temporary
+            directory is used if None.
+
+    Returns:
+        dict: JSON-serialisable results: environment, parameters, per-stage
+        'seconds' and 'peak_rss_mb', and the overall metrics of the detection.
+    """
+    mix = synthetic.DEFAULT_MIX if mix is None else mix
+    with tempfile.TemporaryDirectory() as tmp, warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        workdir = workdir or tmp
+        input_file = os.path.join(workdir, "synthetic.xlsx")
+        output_file = os.path.join(workdir, "synthetic_output.xlsx")
+        stages = {}
+        sheet, truth = _run_stage(stages, "generate", lambda: synthetic.make_sheet(rows, mix, anomaly_rate, seed), 1)
+        _run_stage(stages, "write_ground_truth", lambda: synthetic.write_ground_truth(sheet, truth, input_file), 1)
+        df = _run_stage(stages, "read_sheet", lambda: readers.read_sheet(input_file), repeat)
+        types = _run_stage(stages, "infer_column_types", lambda: anamoly.infer_column_types(df), repeat)
+        rule_anom = _run_stage(stages, "rule_based_anomalies", lambda: anamoly.rule_based_anomalies(df, types), repeat)
+        iso_anom = _run_stage(stages, "isolation_forest_anomalies", lambda: anamoly.isolation_forest_anomalies(df, types), repeat)
+        anomalies = _run_stage(stages, "combine_anomalies", lambda: anamoly.combine_anomalies(rule_anom, iso_anom), repeat)
+        _run_stage(stages, "replace_and_highlight", lambda: anamoly.replace_and_highlight(df, anomalies, output_file), repeat)
+        gt = _run_stage(stages, "accuracy.get_highlight_matrix", lambda: accuracy.get_highlight_matrix(input_file), repeat)
+        pred = _run_stage(stages, "errors.get_highlight_matrix", lambda: errors.get_highlight_matrix(output_file), repeat)
+        overall = accuracy.highlight_metrics(gt, np.array(pred, dtype=int)).loc["All"]
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "packages": {"numpy": np.__version__, "pandas": pd.__version__,
+                     "scikit-learn": sklearn.__version__, "openpyxl": openpyxl.__version__},
+        "params": {"rows": rows, "mix": mix, "anomaly_rate": anomaly_rate, "seed": seed, "repeat": repeat},
+        "cells": int(truth.size),
+        "stages": stages,
+        "peak_rss_mb": peak_rss_mb(),
+        "metrics": {k: float(overall[k]) for k in ("precision", "recall", "f1")},
+    }
+
+def print_results(results, baseline=None):
+    """
+    Print per-stage times, with the ratio to a baseline result (old / new) if given.
+    """
+    print(f"commit {results['commit']}  rows {results['params']['rows']}  cells {results['cells']}")
+    for name, stage in results["stages"].items():
+        line = f"{name:32} {stage['seconds']:9.3f} s"
+        if stage["peak_rss_mb"] is not None:
+            line += f"  {stage['peak_rss_mb']:8.1f} MB"
+        old = (baseline or {}).get("stages", {}).get(name)
+        if old and stage["seconds"] > 0:
+            line += f"  x{old['seconds'] / stage['seconds']:.2f} vs {baseline['commit']}"
+        print(line)
+    m = results["metrics"]
+    print(f"precision {m['precision']*100:.2f}%  recall {m['recall']*100:.2f}%  F1 {m['f1']*100:.2f}%")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the anomaly detection pipeline on a synthetic sheet.")
+    parser.add_argument("--rows", type=int, default=25000)
+    parser.add_argument("--mix", type=synthetic.parse_mix, default=synthetic.DEFAULT_MIX,
+                        help='column kinds and counts, e.g. "int=4,float=3,date=1,category=2"')
+    parser.add_argument("--anomaly-rate", type=float, default=synthetic.DEFAULT_ANOMALY_RATE)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=1, help="runs per stage; the fastest is reported")
+    parser.add_argument("--workdir", default=None, help="keep the generated workbooks in this directory")
+    parser.add_argument("--output", default=None, help="write the results as JSON to this file")
+    parser.add_argument("--compare", default=None, help="earlier JSON results to compare against")
+    parser.add_argument("--startup", action="store_true", help="measure module import times instead of the pipeline")
+    args = parser.parse_args()
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    if args.startup:
+        results = run_startup_benchmark(repeat=max(args.repeat, 5))
+        print_startup(results, baseline)
+    else:
+        results = run_benchmark(args.rows, args.mix, args.anomaly_rate, args.seed, args.repeat, args.workdir)
+        print_results(results, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+# chunked.py
+# Streaming (chunked) rule-based anomaly detection for sheets that do not fit in memory.
+# Pass 1 streams the sheet once and collects the statistics the rules need a global
+# view for: inferred column types, the mode value length and the out-of-range
+# quantiles of each numeric column (kept in small sketches, see sketches.py).
+# Pass 2 streams the sheet again in fixed-size chunks, labels each chunk with the
+# rule engine from anamoly.py and appends it to the highlighted output workbook.
+# Peak memory is bounded by the chunk size, not by the number of rows.
+# The Isolation Forest stage needs the whole sheet and is not part of this mode.
+# CSV inputs are streamed with pandas and Parquet and Arrow inputs one record
+# batch at a time with pyarrow, and a CSV, Parquet or Arrow output path
+# gets a label mask file (see masks.py), so such runs never import openpyxl.
+
+import numpy as np
+import pandas as pd
+from pandas.io.parsers import TextParser
+import anamoly
+import masks
+import readers
+from lengths import value_lengths
+from sketches import LengthHistogram, QuantileSketch
+
+CHUNK_ROWS = 10000
+
+def _convert_cell(value):
+    # Same cell conversion as pd.read_excel's openpyxl reader
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+def iter_chunks(excel_file, chunk_rows=CHUNK_ROWS, sheet_name=None):
+    """
+    Stream a sheet as DataFrames of at most `chunk_rows` rows.
+
+    Cells are converted like pd.read_excel (integral numbers as int, blank and
+    NA strings as NaN), but every column is left as object dtype, because
+    per-chunk dtype inference would differ between chunks; see normalize_chunk.
+    CSV files are streamed with readers.iter_csv_chunks, Parquet and Arrow files
+    with readers.iter_table_chunks.
+
+    Args:
+        excel_file (str): Path to the Excel, CSV, Parquet or Arrow file.
+        chunk_rows (int): Maximum rows per chunk.
+        sheet_name (str, optional): Sheet name to read. If None, uses active sheet.
+
+    Yields:
+        pd.DataFrame: Next chunk, indexed by row position in the sheet.
+    """
+    fmt = readers.file_format(excel_file)
+    if fmt == "csv":
+        yield from readers.iter_csv_chunks(excel_file, chunk_rows)
+        return
+    if fmt in ("parquet", "arrow"):
+        yield from readers.iter_table_chunks(excel_file, chunk_rows)
+        return
+    from openpyxl import load_workbook
+    wb = load_workbook(excel_file, read_only=True, data_only=True)
+    try:
+        ws = wb[sheet_name] if sheet_name else wb.active
+        ws.reset_dimensions()
+        rows = ws.iter_rows(values_only=True)
+        header = [
+            _convert_cell(v) if v is not None else f"Unnamed: {i}"
+            for i, v in enumerate(next(rows, ()))
+        ]
+        width = len(header)
+        batch, blank_rows, start = [], 0, 0
+        for row in rows:
+            row = [_convert_cell(v) for v in row[:width]]
+            row += [""] * (width - len(row))
+            if all(v == "" for v in row):
+                # Trailing blank rows are dropped, like pd.read_excel
+                blank_rows += 1
+                continue
+            batch.extend([[""] * width] * blank_rows)
+            blank_rows = 0
+            batch.append(row)
+            if len(batch) >= chunk_rows:
+                yield _to_frame(batch[:chunk_rows], header, start)
+                start += chunk_rows
+                batch = batch[chunk_rows:]
+        if batch:
+            yield _to_frame(batch, header, start)
+    finally:
+        wb.close()
+
+def _to_frame(batch, header, start):
+    df = TextParser(batch, names=header, header=None, dtype=object).read()
+    df.index = pd.RangeIndex(start, start + len(df))
+    return df
+
+def normalize_chunk(chunk, kinds):
+    """
+    Give a chunk the column dtypes pd.read_excel would give the whole sheet.
+
+    Args:
+        chunk (pd.DataFrame): Object-dtype chunk from iter_chunks.
+        kinds (dict): Column name -> 'int', 'float' or 'object' (from collect_stats).
+
+    Returns:
+        pd.DataFrame: The chunk with 'int'/'float' columns converted.
+    """
+    for col, kind in kinds.items():
+        if kind == 'int':
+            chunk[col] = pd.to_numeric(chunk[col]).astype(np.int64)
+        elif kind == 'float':
+            chunk[col] = pd.to_numeric(chunk[col]).astype(np.float64)
+    return chunk
+
+def collect_stats(excel_file, chunk_rows=CHUNK_ROWS, threshold=0.8, sheet_name=None):
+    """
+    First pass: stream the sheet and collect the global statistics the rules need.
+
+    Args:
+        excel_file (str): Path to the Excel, CSV, Parquet or Arrow file.
+        chunk_rows (int): Rows per chunk.
+        threshold (float): Proportion threshold for type assignment.
+        sheet_name (str, optional): Sheet name to read. If None, uses active sheet.
+
+    Returns:
+        tuple: (types, kinds, stats) where types is the inferred column type
+        mapping, kinds the sheet-wide dtype of each column for normalize_chunk,
+        and stats the numeric_column_stats of each numeric column.
+    """
+    acc = None
+    for chunk in iter_chunks(excel_file, chunk_rows, sheet_name):
+        if acc is None:
+            acc = {col: {
+                'n': 0, 'num': 0, 'dt': 0,
+                'numeric_only': True, 'has_na': False, 'has_float': False,
+                'native_lengths': LengthHistogram(), 'float_lengths': LengthHistogram(),
+                'quantiles': QuantileSketch(),
+            } for col in chunk.columns}
+        for col in chunk.columns:
+            a = acc[col]
+            values = chunk[col].dropna()
+            a['has_na'] |= len(values) < len(chunk)
+            if values.empty:
+                continue
+            coerced = pd.to_numeric(values, errors='coerce')
+            valid = coerced.notnull()
+            a['n'] += len(values)
+            a['num'] += int(valid.sum())
+            a['dt'] += int(pd.to_datetime(values, errors='coerce').notnull().sum())
+            a['numeric_only'] &= bool(valid.all())
+            a['has_float'] |= coerced.dtype.kind == 'f'
+            numbers = coerced[valid].astype(np.float64)
+            # Chunks are object dtype, so this is str() of each value, as in the in-memory path
+            a['native_lengths'].update(value_lengths(values[valid]).to_numpy())
+            a['float_lengths'].update(value_lengths(numbers).to_numpy())
+            a['quantiles'].update(numbers.to_numpy())
+    types, kinds, stats = {}, {}, {}
+    for col, a in (acc or {}).items():
+        if not a['numeric_only']:
+            kinds[col] = 'object'
+        elif a['has_na'] or a['has_float']:
+            kinds[col] = 'float'
+        else:
+            kinds[col] = 'int'
+        if a['n'] == 0:
+            types[col] = 'unknown'
+            continue
+        types[col] = anamoly.classify_column(a['num'] / a['n'], a['dt'] / a['n'], threshold)
+        if types[col] == 'numeric':
+            lengths = a['float_lengths'] if kinds[col] == 'float' else a['native_lengths']
+            lower, upper = anamoly.range_bounds(*(a['quantiles'].quantile(q) for q in anamoly.OUT_OF_RANGE_QUANTILES))
+            stats[col] = {'mode_length': anamoly.mode_length(lengths.counts()), 'lower': lower, 'upper': upper}
+    return types, kinds, stats
+
+def detect_chunked(input_file, output_file, chunk_rows=CHUNK_ROWS, sheet_name=None):
+    """
+    Run rule-based detection on a sheet in two streaming passes and write the
+    highlighted output workbook (or label mask file) incrementally.
+
+    Args:
+        input_file (str): Path to the input Excel, CSV, Parquet or Arrow file.
+        output_file (str): Path to output Excel file, or CSV/Parquet/Arrow mask file.
+        chunk_rows (int): Rows per chunk; bounds peak memory.
+        sheet_name (str, optional): Sheet name to read. If None, uses active sheet.
+
+    Returns:
+        tuple: (types, stats) collected in the first pass.
+    """
+    types, kinds, stats = collect_stats(input_file, chunk_rows, sheet_name=sheet_name)
+    if not readers.is_workbook(output_file):
+        with masks.MaskWriter(output_file, list(types)) as writer:
+            for chunk in iter_chunks(input_file, chunk_rows, sheet_name):
+                chunk = normalize_chunk(chunk, kinds)
+                writer.write(anamoly.rule_based_anomalies(chunk, types, stats=stats))
+        return types, stats
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(anamoly.OUTPUT_SHEET_NAME)
+    ws.append(anamoly.header_cells(ws, types))
+    fill = anamoly.highlight_fill()
+    for chunk in iter_chunks(input_file, chunk_rows, sheet_name):
+        chunk = normalize_chunk(chunk, kinds)
+        labels = anamoly.rule_based_anomalies(chunk, types, stats=stats)
+        anamoly.append_highlighted_rows(ws, chunk, labels, fill, chunk_rows)
+    wb.save(output_file)
+    return types, stats
+
+if __name__ == "__main__":
+    detect_chunked(anamoly.INPUT_FILE, anamoly.OUTPUT_FILE)
+    print("Done. Please check the output file for highlighted errors.")
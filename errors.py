@@ -3,12 +3,27 @@
 # create an Excel file with missed, identified, and overpredicted cells,
 # and write these results to a new Excel file with appropriate highlighting.
 # missed (red), identified (green), and overpredicted (yellow) cells.
+# When the result path is a CSV, Parquet or Arrow file, the report is written
+# as a mask file instead (1 missed, 2 identified, 3 overpredicted; see masks.py)
+# and openpyxl is never imported. Several sheets of a workbook can be
+# reported in one workbook (write_sheet_error_report).
 
-import openpyxl
-import pandas as pd
-from openpyxl.styles import PatternFill
+import os
+import re
+import tempfile
+import zipfile
+import numpy as np
+import highlights
+import instrument
+import masks
+import ooxml
+import readers
 
+MISSED_COLOR = "FF0000"
+IDENTIFIED_COLOR = "00FF00"
 HIGHLIGHT_COLOR = "FFFF00"
+# Report fill per colour code 1-3: missed, identified, overpredicted
+REPORT_COLORS = (MISSED_COLOR, IDENTIFIED_COLOR, HIGHLIGHT_COLOR)
 
 def get_highlight_matrix(excel_file, sheet_name=None):
     """
@@ -21,16 +36,7 @@ def get_highlight_matrix(excel_file, sheet_name=None):
     Returns:
         list: 2D list of binary highlight values (1 if highlighted, 0 otherwise).
     """
-    wb = openpyxl.load_workbook(excel_file, data_only=True)
-    ws = wb[sheet_name] if sheet_name else wb.active
-    matrix = []
-    for row in ws.iter_rows():
-        # Ignore the first column
-        matrix.append([
-            1 if cell.fill and cell.fill.start_color and cell.fill.start_color.rgb != "00000000" and cell.fill.fill_type else 0
-            for cell in row[1:]
-        ])
-    return matrix
+    return highlights.get_highlight_matrix(excel_file, sheet_name).astype(int).tolist()
 
 
 
@@ -38,28 +44,184 @@ def write_missed_identified_fp_excel(template_file, missed_matrix, identified_ma
     """
     Writes missed, identified, and overpredicted cells to a new Excel file with appropriate highlighting.
 
+    The template's active sheet XML is streamed and only the style index of the
+    flagged cells is rewritten (to copies of their styles with the report fill),
+    so the rest of the template is copied byte for byte and memory stays
+    constant. Templates whose XML cannot be patched that way are streamed
+    through openpyxl instead (see _write_report_openpyxl).
+
     Args:
         template_file (str): Path to the template Excel file.
-        missed_matrix (list): Matrix of missed errors (red).
-        identified_matrix (list): Matrix of identified errors (green).
-        fp_matrix (list): Matrix of overpredicted errors (yellow).
+        missed_matrix (np.ndarray): Bool matrix of missed errors (red).
+        identified_matrix (np.ndarray): Bool matrix of identified errors (green).
+        fp_matrix (np.ndarray): Bool matrix of overpredicted errors (yellow).
         result_f (str): Path to the result Excel file.
+        All matrices exclude the template's first column and include its header row.
+    """
+    _write_report_workbook(template_file, report_codes(missed_matrix, identified_matrix, fp_matrix), result_f)
+
+def _write_report_workbook(template_file, codes, result_f):
+    tmp_file = result_f + ".tmp"
+    try:
+        _recolor_template(template_file, codes, tmp_file)
+    except ooxml.Unpatchable:
+        _write_report_openpyxl(template_file, codes, tmp_file)
+    os.replace(tmp_file, result_f)
+
+def report_codes(missed_matrix, identified_matrix, fp_matrix):
+    """
+    Merge the three report matrices into one code matrix: 0 unchanged, then
+    1 missed, 2 identified, 3 overpredicted (one per REPORT_COLORS entry).
     """
-    wb = openpyxl.load_workbook(template_file)
-    ws = wb.active
-    red_fill = PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid")
-    green_fill = PatternFill(start_color="00FF00", end_color="00FF00", fill_type="solid")
-    yellow_fill = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
-    for i, (missed_row, identified_row, fp_row) in enumerate(zip(missed_matrix, identified_matrix, fp_matrix)):
-        for j, (missed, identified, fp) in enumerate(zip(missed_row, identified_row, fp_row)):
-            cell = ws.cell(row=i+1, column=j+2)  # +2 to skip first column
-            if missed:
-                cell.fill = red_fill
-            elif identified:
-                cell.fill = green_fill
-            elif fp:
-                cell.fill = yellow_fill
-    wb.save(result_f)
+    return np.select(
+        [np.asarray(m, dtype=bool) for m in (missed_matrix, identified_matrix, fp_matrix)],
+        [1, 2, 3],
+        default=0,
+    ).astype(np.uint8)
+
+def error_codes(gt, model, out=None, block_rows=highlights.BLOCK_ROWS):
+    """
+    Report codes (see report_codes) of two highlight matrices, computed
+    `block_rows` rows at a time so memory-mapped inputs are never loaded whole.
+
+    Args:
+        gt (np.ndarray): Ground truth highlight matrix.
+        model (np.ndarray): Model output highlight matrix.
+        out (np.ndarray, optional): uint8 array of the same shape (e.g. a memmap)
+            to write the codes into. A new array is allocated if None.
+        block_rows (int): Rows per block.
+
+    Returns:
+        np.ndarray: uint8 code matrix.
+    """
+    if gt.shape != model.shape:
+        raise ValueError("Ground truth and model output have different shapes after ignoring the first column.")
+    if out is None:
+        out = np.empty(gt.shape, dtype=np.uint8)
+    for start in range(0, len(gt), block_rows):
+        actual = np.asarray(gt[start:start + block_rows], dtype=bool)
+        predicted = np.asarray(model[start:start + block_rows], dtype=bool)
+        out[start:start + block_rows] = report_codes(actual & ~predicted, actual & predicted, ~actual & predicted)
+    return out
+
+def _add_report_styles(styles):
+    """
+    Append one fill per REPORT_COLORS entry and, for each, a copy of every cell
+    style using it. Returns the new styles XML and the number of original cell
+    styles N: the copy of style s for colour code k (1-3) has index k * N + s.
+    """
+    fills = re.search(r"(<fills\b[^>]*>)(.*?)</fills>", styles, re.DOTALL)
+    xfs = re.search(r"(<cellXfs\b[^>]*>)(.*?)</cellXfs>", styles, re.DOTALL)
+    if fills is None or xfs is None or "<xf" not in xfs.group(2):
+        raise ooxml.Unpatchable("styles")
+    n_fills = len(re.findall(r"<fill\b", fills.group(2)))
+    xf_list = re.findall(r"<xf\b[^>]*?(?:/>|>.*?</xf>)", xfs.group(2), re.DOTALL)
+    new_fills = "".join(
+        f'<fill><patternFill patternType="solid"><fgColor rgb="00{c}"/><bgColor rgb="00{c}"/></patternFill></fill>'
+        for c in REPORT_COLORS
+    )
+    new_xfs = []
+    for k in range(len(REPORT_COLORS)):
+        for xf in xf_list:
+            tag_end = xf.index(">") + 1
+            tag = ooxml.set_attribute(ooxml.set_attribute(xf[:tag_end], "fillId", n_fills + k), "applyFill", 1)
+            new_xfs.append(tag + xf[tag_end:])
+    # Later parts first, so the earlier match offsets stay valid
+    parts = sorted([
+        (fills, ooxml.set_attribute(fills.group(1), "count", n_fills + len(REPORT_COLORS)), new_fills),
+        (xfs, ooxml.set_attribute(xfs.group(1), "count", len(xf_list) * (len(REPORT_COLORS) + 1)), "".join(new_xfs)),
+    ], key=lambda part: -part[0].start())
+    for match, open_tag, added in parts:
+        styles = styles[:match.start()] + open_tag + match.group(2) + added + styles[match.end(2):]
+    return styles, len(xf_list)
+
+def _recolor_row(row, codes, n_xfs, pending):
+    i = ooxml.row_number(row) - 1
+    if i not in pending:
+        return row
+    pending.discard(i)
+    row_codes = codes[i]
+    start, row_cells = ooxml.split_row(row)
+    cells = []
+    recolored = set()
+    for column, cell in row_cells:
+        # Matrix columns start at the template's second column
+        j = column - 2
+        if 0 <= j < len(row_codes) and row_codes[j]:
+            tag_end = cell.index(">") + 1
+            tag = cell[:tag_end]
+            style = ooxml.STYLE_RE.search(tag)
+            old = int(style.group(1)) if style else 0
+            cell = ooxml.set_attribute(tag, "s", row_codes[j] * n_xfs + old) + cell[tag_end:]
+            recolored.add(j)
+        cells.append((j, cell))
+    # Flagged cells that are empty in the template have no XML yet
+    for j in np.flatnonzero(row_codes):
+        if j not in recolored:
+            cells.append((j, f'<c r="{ooxml.column_letter(j + 2)}{i + 1}" s="{row_codes[j] * n_xfs}"/>'))
+    cells.sort(key=lambda cell: cell[0])
+    # spans is an optional hint that inserted cells could invalidate
+    return ooxml.SPANS_RE.sub("", start) + "".join(cell for _, cell in cells) + "</row>"
+
+def _recolor_sheet(src, dst, codes, n_xfs):
+    pending = set()
+    for start in range(0, len(codes), highlights.BLOCK_ROWS):
+        pending.update((np.flatnonzero(codes[start:start + highlights.BLOCK_ROWS].any(axis=1)) + start).tolist())
+    ooxml.stream_rows(src, dst, lambda row: _recolor_row(row, codes, n_xfs, pending))
+    if pending:
+        raise ooxml.Unpatchable("flagged rows missing from the template")
+
+def _recolor_template(template_file, codes, result_f):
+    with zipfile.ZipFile(template_file) as zin:
+        # The active sheet's XML for a single matrix, by sheet name for a dict
+        if isinstance(codes, dict):
+            paths = ooxml.sheet_paths(zin, list(codes))
+            sheet_codes = {paths[name]: sheet for name, sheet in codes.items()}
+        else:
+            sheet_codes = {path: codes for path in ooxml.sheet_paths(zin).values()}
+        styles_path = ooxml.styles_path(zin)
+        styles, n_xfs = _add_report_styles(zin.read(styles_path).decode("utf-8"))
+        rewriters = {path: (lambda src, dst, sheet=sheet: _recolor_sheet(src, dst, sheet, n_xfs))
+                     for path, sheet in sheet_codes.items()}
+        rewriters[styles_path] = lambda src, dst: dst.write(styles.encode("utf-8"))
+        ooxml.rewrite_package(zin, result_f, rewriters)
+
+def _write_report_openpyxl(template_file, codes, result_f):
+    # Fallback: stream the template through openpyxl (read-only in, write-only out),
+    # copying values and number formats; sheets without codes are copied unhighlighted
+    import openpyxl
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import PatternFill
+    fills = [None] + [PatternFill(start_color=c, end_color=c, fill_type="solid") for c in REPORT_COLORS]
+    template = openpyxl.load_workbook(template_file, read_only=True)
+    try:
+        wb = Workbook(write_only=True)
+        for ws_in in template.worksheets:
+            ws = wb.create_sheet(ws_in.title)
+            if isinstance(codes, dict):
+                sheet_codes = codes.get(ws_in.title)
+            else:
+                sheet_codes = codes if ws_in is template.active else None
+            for i, row in enumerate(ws_in.iter_rows()):
+                row_codes = sheet_codes[i] if sheet_codes is not None and i < len(sheet_codes) else ()
+                ws.append([_report_cell(ws, cell, fills[row_codes[j - 1]] if 0 < j <= len(row_codes) else None, WriteOnlyCell)
+                           for j, cell in enumerate(row)])
+        wb.save(result_f)
+    finally:
+        template.close()
+
+def _report_cell(ws, cell, fill, cell_type):
+    value = getattr(cell, "value", None)
+    number_format = getattr(cell, "number_format", None) or "General"
+    if fill is None and number_format == "General":
+        return value
+    out = cell_type(ws, value=value)
+    if fill is not None:
+        out.fill = fill
+    if number_format != "General":
+        out.number_format = number_format
+    return out
 
 
 def create_error_excel_combined(input_f, output_f, result_f):
@@ -75,15 +237,84 @@ def create_error_excel_combined(input_f, output_f, result_f):
     Prints:
         Summary of missed (red), identified (green), and overpredicted (yellow) errors.
     """
-    gt = get_highlight_matrix(input_f)
-    model = get_highlight_matrix(output_f)
-    gt_arr = pd.DataFrame(gt)
-    model_arr = pd.DataFrame(model)
-    missed = ((gt_arr == 1) & (model_arr == 0)).astype(int).values.tolist()
-    identified = ((gt_arr == 1) & (model_arr == 1)).astype(int).values.tolist()
-    false_positive = ((gt_arr == 0) & (model_arr == 1)).astype(int).values.tolist()
-    write_missed_identified_fp_excel(input_f, missed, identified, false_positive, result_f)
-    print(f"Missed (red), identified (green), and overpredicted (yellow) errors saved to {result_f}")
+    gt = highlights.get_highlight_matrix(input_f)
+    model = highlights.get_highlight_matrix(output_f)
+    write_error_report(gt, model, input_f, result_f)
+
+@instrument.instrumented("write_error_report")
+def write_error_report(gt, model, template_file, result_f):
+    """
+    Writes the missed/identified/overpredicted report for two highlight matrices.
+
+    The report codes are computed in row blocks. If either matrix is memory-mapped
+    (see highlights.cached_highlight_matrix), the codes are kept in a temporary
+    memory-mapped file as well, so the report is written within a fixed memory budget.
+
+    Args:
+        gt (np.ndarray): Ground truth highlight matrix.
+        model (np.ndarray): Model output highlight matrix.
+        template_file (str): Path to the template (ground truth) Excel file, or mask file.
+        result_f (str): Path to result Excel file, or mask file for the report codes.
+
+    Prints:
+        Summary of missed (red), identified (green), and overpredicted (yellow) errors.
+    """
+    workbook = readers.is_workbook(result_f)
+    if workbook and not readers.is_workbook(template_file):
+        raise ValueError(f"An Excel report needs a workbook template; write a mask file instead of {result_f}")
+    mapped = isinstance(gt, np.memmap) or isinstance(model, np.memmap)
+    gt = np.asarray(gt)
+    model = np.asarray(model)
+    with tempfile.TemporaryDirectory() as tmp:
+        out = None
+        if mapped and gt.size:
+            out = np.lib.format.open_memmap(os.path.join(tmp, "codes.npy"), mode="w+", dtype=np.uint8, shape=gt.shape)
+        codes = error_codes(gt, model, out)
+        if workbook:
+            _write_report_workbook(template_file, codes, result_f)
+        else:
+            _write_report_mask(codes, readers.read_columns(template_file), result_f)
+        del codes, out
+    if workbook:
+        print(f"Missed (red), identified (green), and overpredicted (yellow) errors saved to {result_f}")
+    else:
+        print(f"Missed (1), identified (2), and overpredicted (3) cells saved to {result_f}")
+
+@instrument.instrumented("write_sheet_error_report")
+def write_sheet_error_report(gts, models, template_file, result_f):
+    """
+    Writes one missed/identified/overpredicted workbook for several sheets.
+
+    Each sheet of the template named in `gts` is recoloured with the report of
+    its pair of highlight matrices (see write_error_report); the template's
+    other sheets are copied unchanged.
+
+    Args:
+        gts (dict): Sheet name -> ground truth highlight matrix.
+        models (dict): Sheet name -> model output highlight matrix.
+        template_file (str): Path to the template (ground truth) Excel file.
+        result_f (str): Path to the result Excel file.
+
+    Prints:
+        Summary of missed (red), identified (green), and overpredicted (yellow) errors.
+    """
+    if not (readers.is_workbook(template_file) and readers.is_workbook(result_f)):
+        raise ValueError("A report for several sheets needs a workbook template and result file.")
+    codes = {}
+    for name, gt in gts.items():
+        try:
+            codes[name] = error_codes(np.asarray(gt), np.asarray(models[name]))
+        except ValueError as exc:
+            raise ValueError(f"Sheet {name!r}: {exc}") from None
+    _write_report_workbook(template_file, codes, result_f)
+    print(f"Missed (red), identified (green), and overpredicted (yellow) errors in {len(codes)} sheets saved to {result_f}")
+
+def _write_report_mask(codes, columns, result_f):
+    # Back to the data layout (see masks.data_layout), one block at a time
+    with masks.MaskWriter(result_f, columns) as writer:
+        for start in range(1, len(codes), highlights.BLOCK_ROWS):
+            block = codes[start:start + highlights.BLOCK_ROWS]
+            writer.write(np.hstack([np.zeros((len(block), 1), dtype=np.uint8), block]))
 
 if __name__ == "__main__":
     # Example usage
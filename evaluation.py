@@ -0,0 +1,140 @@
+# evaluation.py
+# Evaluates model output against ground truth in one pass over each workbook:
+# both highlight matrices are read once (streaming, read-only) and shared by
+# the metrics report (accuracy.py) and the missed/identified/overpredicted
+# workbook (errors.py). Predictions can also be evaluated straight from the
+# in-memory label matrix, without reading the model output workbook back.
+# Any of the files may be a mask file instead of a workbook (see masks.py).
+# With a cache directory, highlight matrices are kept as memory-mapped .npy
+# files and reduced in row blocks, so huge evaluations run in bounded memory and
+# re-evaluating against the same ground truth does not parse it again.
+# Several sheets of one workbook are evaluated together into one report
+# workbook, with per-sheet and combined metrics (evaluate_sheet_predictions).
+
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+import accuracy
+import errors
+import masks
+from highlights import cached_highlight_matrix, get_highlight_matrix, highlight_matrices, write_highlight_matrix
+
+def evaluate_files(input_f, output_f, result_f, sheet1=None, sheet2=None, cache_dir=None):
+    """
+    Prints metrics and writes the error analysis workbook for a model output file.
+
+    Args:
+        input_f (str): Path to ground truth Excel file.
+        output_f (str): Path to model output Excel file.
+        result_f (str): Path to result Excel file.
+        sheet1, sheet2 (str, optional): Sheet names for each file.
+        cache_dir (str, optional): If set, the ground truth matrix is cached there
+            (see highlights.cached_highlight_matrix) and the model output matrix is
+            memory-mapped from a temporary file, so neither is held in memory.
+
+    Returns:
+        pd.DataFrame: Per-column and overall metrics (see accuracy.highlight_metrics).
+    """
+    gt = cached_highlight_matrix(input_f, sheet1, cache_dir)
+    if not cache_dir:
+        model = get_highlight_matrix(output_f, sheet2)
+        metrics = accuracy.print_highlight_metrics(gt, model)
+        errors.write_error_report(gt, model, input_f, result_f)
+        return metrics
+    with tempfile.TemporaryDirectory(dir=cache_dir) as tmp:
+        model = write_highlight_matrix(output_f, os.path.join(tmp, "model.npy"), sheet2)
+        metrics = accuracy.print_highlight_metrics(gt, model)
+        errors.write_error_report(gt, model, input_f, result_f)
+        del model
+    return metrics
+
+def prediction_matrix(anomalies):
+    """
+    Lays out a label matrix like a highlight matrix read from the output workbook:
+    a leading all-False header row, and the first (ID) column dropped.
+
+    Args:
+        anomalies (np.ndarray): Label matrix (non-zero = anomaly) aligned with the input DataFrame.
+
+    Returns:
+        np.ndarray: 2D bool array.
+    """
+    return masks.highlight_layout(np.asarray(anomalies) != 0)
+
+def evaluate_predictions(input_f, anomalies, result_f, sheet_name=None, verbose=True, cache_dir=None):
+    """
+    Prints metrics and writes the error analysis workbook for in-memory predictions.
+
+    Only the ground truth is read from disk, so this can run while (or before)
+    the highlighted output workbook is being written.
+
+    Args:
+        input_f (str): Path to ground truth Excel file or mask file.
+        anomalies (np.ndarray): Label matrix aligned with the input DataFrame.
+        result_f (str): Path to result Excel file, or mask file for the report codes.
+        sheet_name (str, optional): Ground truth sheet name. If None, uses active sheet.
+        verbose (bool): Print the metrics report (the table is returned either way).
+        cache_dir (str, optional): Keep the ground truth matrix there as a memory-mapped
+            file (see highlights.cached_highlight_matrix); later evaluations against
+            the same unchanged ground truth do not parse it again.
+
+    Returns:
+        pd.DataFrame: Per-column and overall metrics (see accuracy.highlight_metrics).
+    """
+    gt = cached_highlight_matrix(input_f, sheet_name, cache_dir)
+    model = prediction_matrix(anomalies)
+    if verbose:
+        metrics = accuracy.print_highlight_metrics(gt, model)
+    else:
+        metrics = accuracy.highlight_metrics(gt, model)
+    errors.write_error_report(gt, model, input_f, result_f)
+    return metrics
+
+def evaluate_sheet_predictions(input_f, anomalies, result_f, verbose=True, cache_dir=None):
+    """
+    Evaluates in-memory predictions for several sheets of one workbook (see
+    evaluate_predictions), writing a single error analysis workbook.
+
+    The ground truth workbook is opened once for all the sheets.
+
+    Args:
+        input_f (str): Path to the ground truth Excel file.
+        anomalies (dict): Sheet name -> label matrix aligned with that sheet's DataFrame.
+        result_f (str): Path to the result Excel file.
+        verbose (bool): Print each sheet's overall metrics and the combined metrics.
+        cache_dir (str, optional): Cache directory for the ground truth matrices
+            (see highlights.cached_highlight_matrix).
+
+    Returns:
+        tuple: (summary, tables). summary is a pd.DataFrame with the overall confusion
+        counts and metrics of each sheet plus a combined "All" row; tables maps each
+        sheet name to its per-column metrics (see accuracy.highlight_metrics).
+    """
+    gts = highlight_matrices(input_f, list(anomalies), cache_dir)
+    models = {name: prediction_matrix(labels) for name, labels in anomalies.items()}
+    tables = {}
+    for name, gt in gts.items():
+        try:
+            tables[name] = accuracy.highlight_metrics(gt, models[name])
+        except ValueError as exc:
+            raise ValueError(f"Sheet {name!r}: {exc}") from None
+    counts = pd.DataFrame(
+        [table.loc["All", ["tp", "fp", "fn", "tn"]] for table in tables.values()],
+        index=pd.Index(list(tables), name="sheet"),
+        columns=["tp", "fp", "fn", "tn"],
+    ).astype(int)
+    counts.loc["All"] = counts.sum()
+    summary = accuracy.metrics_from_counts(counts)
+    if verbose:
+        for row in summary.iloc[:-1].itertuples():
+            print(f"{row.Index}: precision {row.precision*100:.2f}%  recall {row.recall*100:.2f}%  F1 {row.f1*100:.2f}%")
+        print(f"\n--- Combined Metrics ({len(tables)} sheets) ---")
+        accuracy.print_metrics_row(next(summary.loc[["All"]].itertuples()))
+    errors.write_sheet_error_report(gts, models, input_f, result_f)
+    return summary, tables
+
+if __name__ == "__main__":
+    # Usage: Enter the file name (without extension) to evaluate, e.g. "Train"
+    input_base = input("Enter file name (without extension) to evaluate: ").strip()
+    evaluate_files(input_base + ".xlsx", input_base + "_output.xlsx", input_base + "_missed_and_identified.xlsx")
@@ -0,0 +1,221 @@
+# highlights.py
+# Reads the highlighted (filled) cells of an Excel sheet into a boolean matrix.
+# Shared by accuracy.py, errors.py and evaluation.py so each workbook is
+# streamed once in read-only mode instead of being fully loaded per consumer.
+# Ground truth can also be a mask file (see masks.py); openpyxl is then never imported.
+# Large matrices can be written to .npy files block by block and memory-mapped,
+# and the ground truth of an unchanged workbook is cached that way between runs.
+# Several sheets can be read with one open of the workbook (highlight_matrices).
+
+import os
+import numpy as np
+import instrument
+import masks
+import readers
+
+# Rows per block when highlight matrices are streamed to disk or reduced block-wise.
+BLOCK_ROWS = 65536
+# File name suffix of highlight matrices in the cache directory (see cached_highlight_matrix).
+HIGHLIGHTS_SUFFIX = ".highlights.npy"
+
+def is_highlighted(fill):
+    """
+    True if a cell fill counts as a highlight (any non-default solid/pattern fill).
+    """
+    return bool(fill and fill.start_color and fill.start_color.rgb != "00000000" and fill.fill_type)
+
+def _to_block(rows):
+    width = max((len(r) for r in rows), default=0)
+    block = np.zeros((len(rows), width), dtype=bool)
+    for i, flags in enumerate(rows):
+        block[i, :len(flags)] = flags
+    return block
+
+def _iter_sheet_blocks(ws, block_rows):
+    seen = {}
+    rows = []
+    for row in ws.iter_rows():
+        flags = []
+        for cell in row[1:]:
+            fill = getattr(cell, "fill", None)
+            key = id(fill)
+            if key not in seen:
+                seen[key] = is_highlighted(fill)
+            flags.append(seen[key])
+        rows.append(flags)
+        if len(rows) == block_rows:
+            yield _to_block(rows)
+            rows = []
+    if rows:
+        yield _to_block(rows)
+
+def iter_highlight_blocks(excel_file, sheet_name=None, block_rows=BLOCK_ROWS):
+    """
+    Stream the highlight matrix of a sheet (see get_highlight_matrix) in row blocks.
+
+    Args:
+        excel_file (str): Path to the Excel file, or to a mask file (read as one block).
+        sheet_name (str, optional): Sheet name to read. If None, uses active sheet.
+        block_rows (int): Rows per block.
+
+    Yields:
+        np.ndarray: 2D bool array of the next rows, padded with False to the
+        widest row of the block.
+    """
+    if not readers.is_workbook(excel_file):
+        yield masks.read_highlight_matrix(excel_file)
+        return
+    import openpyxl
+    wb = openpyxl.load_workbook(excel_file, read_only=True, data_only=True)
+    try:
+        yield from _iter_sheet_blocks(wb[sheet_name] if sheet_name else wb.active, block_rows)
+    finally:
+        wb.close()
+
+def _assemble(blocks):
+    blocks = list(blocks)
+    width = max((b.shape[1] for b in blocks), default=0)
+    matrix = np.zeros((sum(len(b) for b in blocks), width), dtype=bool)
+    start = 0
+    for block in blocks:
+        matrix[start:start + len(block), :block.shape[1]] = block
+        start += len(block)
+    return matrix
+
+def get_highlight_matrix(excel_file, sheet_name=None):
+    """
+    Extracts a boolean matrix from highlighted cells in an Excel file, ignoring the first column.
+
+    The sheet is streamed in read-only mode; fills are shared objects in the
+    workbook's style table, so each distinct fill is classified only once.
+    A CSV, Parquet or Arrow path is read as a mask file instead (non-zero = highlighted).
+
+    Args:
+        excel_file (str): Path to the Excel file, or to a mask file.
+        sheet_name (str, optional): Sheet name to read. If None, uses active sheet.
+
+    Returns:
+        np.ndarray: 2D bool array, True where a cell is highlighted. Rows include
+        the header row; ragged rows are padded with False.
+    """
+    with instrument.stage(f"get_highlight_matrix[{os.path.basename(excel_file)}]") as record:
+        matrix = _assemble(iter_highlight_blocks(excel_file, sheet_name))
+        record.update(rows=matrix.shape[0], cells=matrix.size)
+    return matrix
+
+def _save_blocks(blocks, path):
+    # Blocks go to a scratch file first because the .npy header needs the final shape
+    scratch = path + ".blocks"
+    shapes = []
+    with open(scratch, "wb") as f:
+        for block in blocks:
+            f.write(block.tobytes())
+            shapes.append(block.shape)
+    shape = (sum(rows for rows, _ in shapes), max((width for _, width in shapes), default=0))
+    tmp_file = path + ".tmp.npy"
+    try:
+        if shape[0] * shape[1] == 0:
+            np.save(tmp_file, np.zeros(shape, dtype=bool))
+        else:
+            stored = np.memmap(scratch, dtype=bool, mode="r")
+            matrix = np.lib.format.open_memmap(tmp_file, mode="w+", dtype=bool, shape=shape)
+            start = offset = 0
+            for rows, width in shapes:
+                matrix[start:start + rows, :width] = stored[offset:offset + rows * width].reshape(rows, width)
+                start += rows
+                offset += rows * width
+            matrix.flush()
+            del matrix, stored
+        os.replace(tmp_file, path)
+    finally:
+        os.remove(scratch)
+    return shape
+
+def write_highlight_matrix(excel_file, path, sheet_name=None, block_rows=BLOCK_ROWS):
+    """
+    Write the highlight matrix of a sheet to a .npy file without holding it in memory.
+
+    Blocks are appended to a scratch file as they are read, then copied into the
+    .npy file (whose header needs the final shape) block by block, so memory use
+    is bounded by `block_rows` whatever the size of the sheet.
+
+    Args:
+        excel_file (str): Path to the Excel file, or to a mask file.
+        path (str): .npy file to write.
+        sheet_name (str, optional): Sheet name to read. If None, uses active sheet.
+        block_rows (int): Rows per block.
+
+    Returns:
+        np.ndarray: The matrix, memory-mapped read-only from `path`.
+    """
+    with instrument.stage(f"write_highlight_matrix[{os.path.basename(excel_file)}]") as record:
+        shape = _save_blocks(iter_highlight_blocks(excel_file, sheet_name, block_rows), path)
+        record.update(rows=shape[0], cells=shape[0] * shape[1])
+    return np.load(path, mmap_mode="r")
+
+def _cache_path(excel_file, sheet_name, cache_dir):
+    return os.path.join(cache_dir, readers.file_key(excel_file, sheet_name) + HIGHLIGHTS_SUFFIX)
+
+def cached_highlight_matrix(excel_file, sheet_name=None, cache_dir=None):
+    """
+    Highlight matrix of a sheet, kept in `cache_dir` as a memory-mapped .npy file.
+
+    The file is keyed like the parsed-sheet cache (readers.file_key: contents,
+    mtime and sheet), so evaluating new predictions against an unchanged ground
+    truth maps the stored matrix instead of parsing the workbook again.
+
+    Args:
+        excel_file (str): Path to the Excel file, or to a mask file.
+        sheet_name (str, optional): Sheet name to read. If None, uses active sheet.
+        cache_dir (str, optional): Cache directory. If None, the matrix is read into memory.
+
+    Returns:
+        np.ndarray: 2D bool array (a read-only memmap if cached); see get_highlight_matrix.
+    """
+    if not cache_dir:
+        return get_highlight_matrix(excel_file, sheet_name)
+    path = _cache_path(excel_file, sheet_name, cache_dir)
+    if os.path.exists(path):
+        return np.load(path, mmap_mode="r")
+    os.makedirs(cache_dir, exist_ok=True)
+    return write_highlight_matrix(excel_file, path, sheet_name)
+
+def highlight_matrices(excel_file, sheet_names, cache_dir=None):
+    """
+    Highlight matrices of several sheets, opening the workbook only once.
+
+    Args:
+        excel_file (str): Path to the Excel file.
+        sheet_names (list): Sheets to read.
+        cache_dir (str, optional): Cache directory (see cached_highlight_matrix);
+            cached sheets are memory-mapped and only the others are read.
+
+    Returns:
+        dict: Sheet name -> 2D bool array (see get_highlight_matrix).
+    """
+    matrices = {}
+    paths = {}
+    if cache_dir:
+        for name in sheet_names:
+            paths[name] = _cache_path(excel_file, name, cache_dir)
+            if os.path.exists(paths[name]):
+                matrices[name] = np.load(paths[name], mmap_mode="r")
+    missing = [name for name in sheet_names if name not in matrices]
+    if missing:
+        import openpyxl
+        with instrument.stage(f"highlight_matrices[{os.path.basename(excel_file)}]") as record:
+            wb = openpyxl.load_workbook(excel_file, read_only=True, data_only=True)
+            try:
+                for name in missing:
+                    blocks = _iter_sheet_blocks(wb[name], BLOCK_ROWS)
+                    if cache_dir:
+                        os.makedirs(cache_dir, exist_ok=True)
+                        _save_blocks(blocks, paths[name])
+                        matrices[name] = np.load(paths[name], mmap_mode="r")
+                    else:
+                        matrices[name] = _assemble(blocks)
+            finally:
+                wb.close()
+            record.update(rows=sum(matrices[name].shape[0] for name in missing),
+                          cells=sum(matrices[name].size for name in missing))
+    return {name: matrices[name] for name in sheet_names}
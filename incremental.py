@@ -0,0 +1,280 @@
+# incremental.py
+# Incremental re-detection for sheets that are re-uploaded with a few edited rows.
+# The first run is a full detection; it saves a state file with a content hash per
+# row, the rendered length of every numeric cell, the per-column rule statistics,
+# the fitted Isolation Forest and the labels.
+# Later runs diff the new sheet against that state and only
+#   - re-run the rules on changed rows (a column is recomputed in full only when
+#     its new quantile/mode statistics would change the label of an unchanged row),
+#   - measure the lengths of changed rows; the mode lengths are recounted from the
+#     stored lengths, but the out-of-range quantiles are recomputed exactly from
+#     every parsed numeric column, an O(rows) pass per numeric column on each run
+#     (the same order as reading and hashing the sheet, which every run does;
+#     mergeable sketches would make the labels differ from a full run),
+#   - score changed rows with the stored forest (fit once, as with MODEL_FILE),
+#   - rewrite the changed rows in the existing output workbook's sheet XML,
+#     instead of regenerating the whole workbook.
+
+import numbers
+import os
+import zipfile
+from xml.sax.saxutils import escape
+import numpy as np
+import pandas as pd
+import anamoly
+import ooxml
+import readers
+from lengths import value_lengths
+
+STATE_SUFFIX = ".state"
+
+def _hash_column(values):
+    # Numbers as floats and missing values as NaN, whatever the column's dtype: when
+    # one cell of a float column becomes text, read_excel returns the column as
+    # object with its whole floats as ints, which must still hash like before
+    if values.dtype.kind in 'iufb':
+        out = values.to_numpy(dtype=np.float64).astype(object)
+    else:
+        out = np.array([
+            float(v) if isinstance(v, numbers.Real) and not isinstance(v, (bool, np.bool_)) else v
+            for v in values.to_numpy(dtype=object)
+        ], dtype=object)
+    out[values.isna().to_numpy()] = np.nan
+    return out
+
+def row_hashes(df):
+    """
+    Content hash of every row (the index is ignored).
+
+    Each cell is hashed by a normalised value (numbers as float, missing as NaN),
+    so a column changing dtype (e.g. float64 to object when one cell becomes
+    text) does not mark every row as changed.
+
+    Returns:
+        np.ndarray: uint64 hash per row.
+    """
+    normalised = pd.DataFrame({j: _hash_column(df[col]) for j, col in enumerate(df.columns)}, index=df.index)
+    return pd.util.hash_pandas_object(normalised, index=False).to_numpy()
+
+def _output_signature(output_file):
+    st = os.stat(output_file)
+    return st.st_size, st.st_mtime_ns
+
+def _resize(labels, n_rows):
+    resized = np.zeros((n_rows, labels.shape[1]), dtype=np.uint8)
+    keep = min(n_rows, len(labels))
+    resized[:keep] = labels[:keep]
+    return resized
+
+def _stats_change_labels(values, old, new):
+    """
+    True if replacing `old` numeric_column_stats by `new` changes the rule label of any of `values`.
+    """
+    if old['mode_length'] != new['mode_length']:
+        return True
+    for key in ('lower', 'upper'):
+        a, b = old[key], new[key]
+        if np.isnan(a) and np.isnan(b):
+            continue
+        if np.isnan(a) or np.isnan(b):
+            return True
+        lo, hi = min(a, b), max(a, b)
+        # x < lower differs between the two bounds for lo <= x < hi; x > upper for lo < x <= hi
+        crossed = (values >= lo) & (values < hi) if key == 'lower' else (values > lo) & (values <= hi)
+        if crossed.any():
+            return True
+    return False
+
+def _numeric_lengths(df, types, cache):
+    # Rendered length of every valid cell of the numeric columns, -1 where missing or not a number
+    cols = [col for col in df.columns if types[col] == 'numeric']
+    lengths = np.full((len(df), len(cols)), -1, dtype=np.int32)
+    for k, col in enumerate(cols):
+        valid = df[col].notnull().to_numpy() & cache.numeric(col).notnull().to_numpy()
+        lengths[valid, k] = value_lengths(df.loc[valid, col]).to_numpy()
+    return lengths
+
+def _stats_from_lengths(df, types, cache, lengths):
+    # anamoly.rule_stats, with the value lengths taken from the stored matrix
+    cols = [col for col in df.columns if types[col] == 'numeric']
+    stats = {}
+    for k, col in enumerate(cols):
+        col_lengths = lengths[:, k]
+        stats[col] = anamoly.numeric_column_stats(cache.numeric(col), pd.Series(col_lengths[col_lengths >= 0]))
+    return stats
+
+def _subset(df, cache, rows):
+    sub = df.iloc[rows]
+    sub_cache = anamoly.ColumnCache(sub)
+    for kind in ('numeric', 'datetime'):
+        for col, parsed in cache.parsed(kind).items():
+            sub_cache.store(kind, col, parsed.iloc[rows])
+    return sub, sub_cache
+
+def detect_incremental(input_file, output_file, state_file=None, read_cache_dir=None):
+    """
+    Detect anomalies, reusing the previous run's state for unchanged rows.
+
+    Args:
+        input_file (str): Path to the input Excel file.
+        output_file (str): Path to output Excel file (patched in place when possible).
+        state_file (str, optional): State file path. Defaults to output_file + STATE_SUFFIX.
+        read_cache_dir (str, optional): Parsed-sheet cache directory (see readers.read_sheet). None disables it.
+
+    Returns:
+        tuple: (combined label matrix, number of data rows rewritten in the output).
+    """
+    import joblib
+    state_file = state_file or output_file + STATE_SUFFIX
+    df = readers.read_sheet(input_file, cache_dir=read_cache_dir)
+    cache = anamoly.ColumnCache(df)
+    hashes = row_hashes(df)
+    state = joblib.load(state_file) if os.path.exists(state_file) else None
+    if state is not None and (state['columns'] != list(df.columns) or 'lengths' not in state):
+        state = None
+
+    if state is None:
+        types = anamoly.infer_column_types(df, cache=cache)
+        model = anamoly.fit_model(df, types, cache=cache)
+        stats = model['stats']
+        rule_anom = anamoly.rule_based_anomalies(df, types, cache=cache, stats=stats)
+        iso_anom = anamoly.isolation_forest_anomalies(df, types, cache=cache, model=model)
+        lengths = _numeric_lengths(df, types, cache)
+        changed = np.arange(len(df))
+    else:
+        model = state['model']
+        types = model['types']
+        old_hashes = state['hashes']
+        same = np.zeros(len(df), dtype=bool)
+        common = min(len(df), len(old_hashes))
+        same[:common] = hashes[:common] == old_hashes[:common]
+        changed = np.flatnonzero(~same)
+        lengths = np.full((len(df), state['lengths'].shape[1]), -1, dtype=np.int32)
+        lengths[:common] = state['lengths'][:common]
+        rule_anom = _resize(state['rule_labels'], len(df))
+        iso_anom = _resize(state['iso_labels'], len(df))
+        if len(changed):
+            sub, sub_cache = _subset(df, cache, changed)
+            lengths[changed] = _numeric_lengths(sub, types, sub_cache)
+        stats = _stats_from_lengths(df, types, cache, lengths)
+        if len(changed):
+            for j, col in enumerate(df.columns):
+                rule_anom[changed, j] = anamoly.column_rule_labels(sub, col, types[col], sub_cache, stats.get(col))
+            iso_anom[changed] = anamoly.isolation_forest_anomalies(sub, types, cache=sub_cache, model=model)
+        for j, col in enumerate(df.columns):
+            if col in stats and _stats_change_labels(cache.numeric(col).to_numpy()[same], state['stats'][col], stats[col]):
+                rule_anom[:, j] = anamoly.column_rule_labels(df, col, types[col], cache, stats[col])
+
+    anomalies = anamoly.combine_anomalies(rule_anom, iso_anom)
+    if state is not None:
+        old = _resize(state['labels'], len(df))
+        changed = np.union1d(changed, np.flatnonzero((anomalies != old).any(axis=1)))
+    rewritten = _write_output(output_file, df, anomalies, changed, state)
+    joblib.dump({
+        'columns': list(df.columns),
+        'hashes': hashes,
+        'lengths': lengths,
+        'model': model,
+        'stats': stats,
+        'rule_labels': rule_anom,
+        'iso_labels': iso_anom,
+        'labels': anomalies,
+        'output': _output_signature(output_file),
+    }, state_file)
+    return anomalies, rewritten
+
+def _write_output(output_file, df, anomalies, rows, state):
+    # Patch the previous output if it is still exactly the file we wrote; otherwise regenerate it
+    if state is not None and os.path.exists(output_file) and _output_signature(output_file) == state['output']:
+        if len(rows) == 0 and len(df) == len(state['labels']):
+            return 0
+        try:
+            patch_output(output_file, df, anomalies, rows)
+            return len(rows)
+        except ooxml.Unpatchable:
+            pass
+    anamoly.replace_and_highlight(df, anomalies, output_file)
+    return len(df)
+
+def _number_text(value):
+    # Digits of an integer; the shortest repr that round-trips for a float
+    if isinstance(value, numbers.Integral):
+        return str(int(value))
+    value = float(value)
+    if not np.isfinite(value):
+        raise ooxml.Unpatchable("non-finite number")
+    return repr(value)
+
+def _row_xml(excel_row, values, codes, highlight_style):
+    cells = []
+    for j, (value, code) in enumerate(zip(values, codes)):
+        style = ""
+        if code:
+            if highlight_style is None:
+                raise ooxml.Unpatchable("no highlight style")
+            value = anamoly.LABEL_NAMES[code]
+            style = f' s="{highlight_style}"'
+        if value is None:
+            continue
+        ref = f"{ooxml.column_letter(j + 1)}{excel_row}"
+        if isinstance(value, str):
+            space = ' xml:space="preserve"' if value != value.strip() else ""
+            cells.append(f'<c r="{ref}"{style} t="inlineStr"><is><t{space}>{escape(value)}</t></is></c>')
+        elif isinstance(value, (bool, np.bool_)):
+            cells.append(f'<c r="{ref}"{style} t="b"><v>{int(value)}</v></c>')
+        elif isinstance(value, numbers.Real):
+            cells.append(f'<c r="{ref}"{style} t="n"><v>{_number_text(value)}</v></c>')
+        else:
+            # Dates and other types need number formats; leave those to openpyxl
+            raise ooxml.Unpatchable(type(value))
+    return f'<row r="{excel_row}">{"".join(cells)}</row>'
+
+def patch_output(output_file, df, anomalies, rows):
+    """
+    Rewrite only the given data rows of an output workbook written by
+    anamoly.replace_and_highlight, copying every other row's XML unchanged.
+    Rows past the end of df are dropped and new rows are appended.
+
+    The active sheet and the highlight style are looked up in the workbook and
+    its sheet XML is streamed (see ooxml.stream_rows).
+
+    Args:
+        output_file (str): Output workbook to patch in place.
+        df (pd.DataFrame): Current data.
+        anomalies (np.ndarray): Current label matrix.
+        rows (np.ndarray): 0-based data row positions to rewrite.
+
+    Raises:
+        ooxml.Unpatchable: If the workbook or the rows cannot be patched safely.
+    """
+    rows = set(int(r) for r in rows)
+    values = df.astype(object).where(df.notnull(), None)
+    n_rows = len(df)
+    last = [0]
+
+    def render(i):
+        return _row_xml(i + 2, values.iloc[i].tolist(), anomalies[i], highlight_style)
+
+    def rewrite(row):
+        # Row 1 is the header; data row i is Excel row i + 2
+        i = ooxml.row_number(row) - 2
+        if i >= n_rows:
+            return ""
+        last[0] = max(last[0], i + 1)
+        return render(i) if i in rows else row
+
+    def append():
+        return "".join(render(i) for i in range(last[0], n_rows))
+
+    tmp_file = output_file + ".tmp"
+    with zipfile.ZipFile(output_file) as zin:
+        sheet_path, = ooxml.sheet_paths(zin).values()
+        highlight_style = ooxml.solid_fill_style(zin.read(ooxml.styles_path(zin)), anamoly.HIGHLIGHT_COLOR)
+        ooxml.rewrite_package(zin, tmp_file, {
+            sheet_path: lambda src, dst: ooxml.stream_rows(src, dst, rewrite, append),
+        })
+    os.replace(tmp_file, output_file)
+
+if __name__ == "__main__":
+    labels, rewritten = detect_incremental(anamoly.INPUT_FILE, anamoly.OUTPUT_FILE)
+    print(f"Done. {rewritten} rows rewritten in {anamoly.OUTPUT_FILE}.")
@@ -0,0 +1,183 @@
+# instrument.py
+# Per-stage timing and memory instrumentation for the pipeline. Stages are
+# marked with `with instrument.stage(name, rows=..., cells=...)` (or the
+# @instrument.instrumented decorator); they cost nothing unless a Recorder is
+# active. An active Recorder collects wall time, CPU time, rows/cells and the
+# tracemalloc peak of every stage, passes each record to an optional callback,
+# writes them as a JSON report, and can keep a cProfile dump of the slowest
+# top-level stage.
+#
+# Usage:
+#   with instrument.Recorder(profile=True) as recorder:
+#       anamoly.detect_file("Train.xlsx", "Train_output.xlsx", "Train_missed_and_identified.xlsx")
+#   recorder.write_json("Train_profile.json")
+#   recorder.dump_hottest("Train_hottest.prof")   # inspect with python -m pstats
+
+import cProfile
+import functools
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+_recorder = None
+
+class Recorder:
+    """
+    Collects stage records while active (use as a context manager).
+
+    Stages may be nested and may run in other threads (e.g. the background
+    output write); tracemalloc counters are process-wide, so the memory peak of
+    a stage that overlaps another thread's stage includes both.
+
+    Args:
+        trace_memory (bool): Record tracemalloc peaks (slows allocation-heavy stages).
+        callback (callable, optional): Called with each stage record as it finishes.
+        profile (bool): Run each top-level stage of the main thread under cProfile
+            and keep the profile of the slowest one (see dump_hottest).
+    """
+    def __init__(self, trace_memory=True, callback=None, profile=False):
+        self.trace_memory = trace_memory
+        self.callback = callback
+        self.profile = profile
+        self.records = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._hottest = None
+        self._started_tracing = False
+
+    def __enter__(self):
+        global _recorder
+        if _recorder is not None:
+            raise RuntimeError("Another instrument.Recorder is already active.")
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self._start = time.perf_counter()
+        _recorder = self
+        return self
+
+    def __exit__(self, *exc):
+        global _recorder
+        _recorder = None
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        return False
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def _stage(self, name, rows, cells):
+        stack = self._stack()
+        record = {
+            "name": name,
+            "parent": stack[-1]["record"]["name"] if stack else None,
+            "depth": len(stack),
+            "thread": threading.current_thread().name,
+            "rows": rows,
+            "cells": cells,
+        }
+        frame = {"record": record, "child_peak": 0}
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                # reset_peak() below discards the enclosing stage's peak so far; keep it on its frame
+                stack[-1]["child_peak"] = max(stack[-1]["child_peak"], peak)
+            frame["memory_start"] = current
+            tracemalloc.reset_peak()
+        profiler = None
+        if self.profile and not stack and threading.current_thread() is threading.main_thread():
+            profiler = cProfile.Profile()
+        stack.append(frame)
+        wall, cpu = time.perf_counter(), time.process_time()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            record["start"] = wall - self._start
+            record["wall_seconds"] = time.perf_counter() - wall
+            record["cpu_seconds"] = time.process_time() - cpu
+            stack.pop()
+            record["memory_peak_mb"] = None
+            if self.trace_memory:
+                peak = max(tracemalloc.get_traced_memory()[1], frame["child_peak"])
+                record["memory_peak_mb"] = max(peak - frame["memory_start"], 0) / (1 << 20)
+                if stack:
+                    stack[-1]["child_peak"] = max(stack[-1]["child_peak"], peak)
+            with self._lock:
+                self.records.append(record)
+                if profiler is not None and (self._hottest is None or record["wall_seconds"] > self._hottest[0]["wall_seconds"]):
+                    self._hottest = (record, profiler)
+            if self.callback is not None:
+                self.callback(record)
+
+    def report(self):
+        """
+        Returns:
+            list: Stage records (dicts) in start order. Keys: name, parent, depth,
+            thread, start, wall_seconds, cpu_seconds, rows, cells, memory_peak_mb.
+        """
+        return sorted(self.records, key=lambda r: r["start"])
+
+    def write_json(self, path):
+        """
+        Write the report to a JSON file.
+        """
+        with open(path, "w") as f:
+            json.dump({"stages": self.report()}, f, indent=2)
+
+    def dump_hottest(self, path):
+        """
+        Save the cProfile stats of the slowest profiled top-level stage.
+
+        Returns:
+            str or None: Name of that stage, or None if nothing was profiled.
+        """
+        if self._hottest is None:
+            return None
+        record, profiler = self._hottest
+        profiler.dump_stats(path)
+        return record["name"]
+
+@contextmanager
+def _noop_stage():
+    yield {}
+
+def stage(name, rows=None, cells=None):
+    """
+    Context manager marking one pipeline stage. Yields the stage's record dict,
+    so rows/cells that are only known inside the block can be filled in.
+
+    Args:
+        name (str): Stage name.
+        rows (int, optional): Rows processed.
+        cells (int, optional): Cells processed.
+    """
+    if _recorder is None:
+        return _noop_stage()
+    return _recorder._stage(name, rows, cells)
+
+def instrumented(name):
+    """
+    Decorator running the whole function as one stage. If the first argument is
+    a DataFrame or array, its row and cell counts are recorded.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _recorder is None:
+                return func(*args, **kwargs)
+            shape = getattr(args[0], "shape", None) if args else None
+            rows, cells = (shape[0], int(args[0].size)) if shape else (None, None)
+            with stage(name, rows, cells):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
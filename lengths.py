@@ -0,0 +1,254 @@
+# lengths.py
+# Rendered lengths of numeric values for the len_incon rule, computed from the
+# numbers themselves instead of formatting one Python string per cell.
+# Integers count their decimal digits; float64 values find the shortest number
+# of decimals that round-trips (what repr(), and so pandas' astype(str), prints)
+# with exact float64 arithmetic. Narrower floats print their own shortest
+# round-trip digits, which widening to float64 would change, so they are formatted. The float kernel runs under Numba when it is
+# installed and as vectorised NumPy otherwise; the rare values neither can
+# settle (17 significant digits, scientific notation, inf) are formatted.
+#
+# Usage (checks both kernels against astype(str).str.len() and times them):
+#   python lengths.py --values 1000000
+
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+# Float kernel: 'auto' (Numba if installed, else NumPy), 'numba' or 'numpy'.
+LENGTH_BACKEND = "auto"
+# 10, 100, ..., 10**19: thresholds for counting the decimal digits of a uint64
+_POWERS_OF_TEN = 10 ** np.arange(1, 20, dtype=np.uint64)
+# repr() prints floats in [1e-4, 1e16) positionally; the kernels handle those
+# whose digits fit in an exactly representable integer (below 2**53).
+_MIN_POSITIONAL = 1e-4
+_MAX_EXACT = float(2 ** 53)
+# Decimal places tried; 10.0**k is exact for every k up to 22.
+_MAX_DECIMALS = 20
+_SCALES = 10.0 ** np.arange(_MAX_DECIMALS + 1)
+
+_numba_kernel = None
+
+def int_lengths(ints):
+    """
+    Length of str(value) for an integer array, by counting decimal digits.
+
+    Args:
+        ints (np.ndarray): Signed or unsigned integer array.
+
+    Returns:
+        np.ndarray: int64 lengths.
+    """
+    # abs() of int64 min wraps to itself, which the uint64 cast turns back into 2**63
+    magnitude = np.abs(ints.astype(np.int64)).astype(np.uint64) if ints.dtype.kind == 'i' else ints.astype(np.uint64)
+    digits = np.searchsorted(_POWERS_OF_TEN, magnitude, side='right') + 1
+    return (digits + (ints < 0)).astype(np.int64)
+
+def _rendered_length(negative, digits, decimals):
+    # e.g. -12.5: sign + integer digits + '.' + decimals; a whole number still prints '.0'
+    int_digits = np.maximum(digits - decimals, 1)
+    return negative + int_digits + 1 + np.maximum(decimals, 1)
+
+def _float_lengths_numpy(x):
+    out = np.full(len(x), -1, dtype=np.int64)
+    mag = np.abs(x)
+    todo = np.flatnonzero((mag == 0) | ((mag >= _MIN_POSITIONAL) & (mag < _MAX_EXACT)))
+    for k in range(_MAX_DECIMALS + 1):
+        if not todo.size:
+            break
+        values = mag[todo]
+        product = values * _SCALES[k]
+        todo = todo[product < _MAX_EXACT]
+        if not todo.size:
+            break
+        values = mag[todo]
+        rounded = np.rint(values * _SCALES[k])
+        # The product is within one unit of the exact digits, so one of these
+        # three candidates round-trips if any k-decimal string does. The float
+        # division is correctly rounded, so the check is exact.
+        found = np.zeros(len(todo), dtype=bool)
+        m = np.zeros(len(todo))
+        for candidate in (rounded, rounded - 1, rounded + 1):
+            hit = ~found & (candidate >= 0) & (candidate / _SCALES[k] == values)
+            m[hit] = candidate[hit]
+            found |= hit
+        idx = todo[found]
+        digits = np.searchsorted(_POWERS_OF_TEN, m[found].astype(np.uint64), side='right') + 1
+        out[idx] = _rendered_length(np.signbit(x[idx]), digits, k)
+        todo = todo[~found]
+    return out
+
+def _compile_numba_kernel():
+    import numba
+
+    @numba.njit(cache=True)
+    def kernel(x, scales, powers, out):
+        for i in range(len(x)):
+            out[i] = -1
+            mag = abs(x[i])
+            if not (mag == 0 or (mag >= _MIN_POSITIONAL and mag < _MAX_EXACT)):
+                continue
+            for k in range(len(scales)):
+                product = mag * scales[k]
+                if product >= _MAX_EXACT:
+                    break
+                rounded = np.rint(product)
+                m = -1.0
+                for candidate in (rounded, rounded - 1, rounded + 1):
+                    if candidate >= 0 and candidate / scales[k] == mag:
+                        m = candidate
+                        break
+                if m < 0:
+                    continue
+                digits = np.searchsorted(powers, np.uint64(m), side='right') + 1
+                int_digits = max(digits - k, 1)
+                out[i] = (1 if np.signbit(x[i]) else 0) + int_digits + 1 + max(k, 1)
+                break
+
+    return kernel
+
+def numba_available():
+    """
+    True if the Numba float kernel can be used (numba is installed).
+    """
+    global _numba_kernel
+    if _numba_kernel is None:
+        try:
+            _numba_kernel = _compile_numba_kernel()
+        except ImportError:
+            _numba_kernel = False
+    return _numba_kernel is not False
+
+def _float_lengths_numba(x):
+    out = np.empty(len(x), dtype=np.int64)
+    _numba_kernel(x, _SCALES, _POWERS_OF_TEN, out)
+    return out
+
+def float_lengths(floats, backend=None):
+    """
+    Length of str(value) for a float64 array, without formatting every value.
+
+    Values the kernel cannot settle exactly (17 significant digits, magnitudes
+    printed in scientific notation, inf and nan) are formatted with str.
+
+    Args:
+        floats (np.ndarray): float64 array. Narrower floats are rejected: widened,
+            0.1 in float32 prints as 0.10000000149011612.
+        backend (str, optional): 'auto', 'numba' or 'numpy'. If None, uses LENGTH_BACKEND.
+
+    Returns:
+        np.ndarray: int64 lengths.
+    """
+    backend = backend or LENGTH_BACKEND
+    if backend not in ("auto", "numba", "numpy"):
+        raise ValueError(f"Unknown length backend {backend!r}; expected 'auto', 'numba' or 'numpy'")
+    if floats.dtype != np.float64:
+        raise TypeError(f"float_lengths measures float64 values, not {floats.dtype}")
+    x = np.ascontiguousarray(floats)
+    if backend != "numpy" and numba_available():
+        out = _float_lengths_numba(x)
+    elif backend == "numba":
+        raise ImportError("The 'numba' length backend needs the numba package")
+    else:
+        out = _float_lengths_numpy(x)
+    rest = np.flatnonzero(out < 0)
+    if rest.size:
+        out[rest] = pd.Series(x[rest]).astype(str).str.len().to_numpy()
+    return out
+
+def value_lengths(values, backend=None):
+    """
+    Length of str(value) for every value of a Series.
+
+    Integer and float64 columns are measured from their numbers (int_lengths,
+    float_lengths); other dtypes, float32 and float16 included, fall back to
+    astype(str).
+
+    Args:
+        values (pd.Series): Values to measure (without missing values).
+        backend (str, optional): Float kernel; see float_lengths.
+
+    Returns:
+        pd.Series: Lengths, with the same index as values.
+    """
+    kind = values.dtype.kind
+    if kind in 'iu':
+        return pd.Series(int_lengths(values.to_numpy()), index=values.index)
+    if values.dtype == np.float64:
+        return pd.Series(float_lengths(values.to_numpy(), backend), index=values.index)
+    return values.astype(str).str.len()
+
+def check_value_lengths(values, backend=None):
+    """
+    Compare value_lengths with the string lengths it replaces.
+
+    Args:
+        values (pd.Series): Values to measure (without missing values).
+        backend (str, optional): Float kernel; see float_lengths.
+
+    Returns:
+        pd.DataFrame: One row per mismatching value (value, rendered string,
+        expected and computed length); empty if the kernel agrees everywhere.
+    """
+    expected = values.astype(str)
+    computed = value_lengths(values, backend)
+    bad = expected.str.len() != computed
+    return pd.DataFrame({
+        "value": values[bad],
+        "rendered": expected[bad],
+        "expected": expected[bad].str.len(),
+        "computed": computed[bad],
+    })
+
+def sample_values(n, seed=42):
+    """
+    Numbers covering the renderings the kernels must match: whole floats,
+    short and full-precision decimals, tiny and huge magnitudes, signed zeros,
+    inf, float32 values (widened to float64, and as float32), and integers up to
+    the int64 limits.
+
+    Returns:
+        dict: Name -> pd.Series of n values.
+    """
+    rng = np.random.default_rng(seed)
+    scale = 10.0 ** rng.integers(-8, 20, n)
+    places = 10.0 ** rng.integers(0, 7, n)
+    special = np.array([0.0, -0.0, np.inf, -np.inf, 1e-4, 9.999999999999999e-05, 1e16, 9999999999999998.0,
+                        0.1 + 0.2, 2.0 ** 53, 2.0 ** 53 - 1, 5e-324, 1.7976931348623157e308])
+    return {
+        "whole": pd.Series(np.round(rng.normal(0, 1e6, n))),
+        "decimals": pd.Series(np.rint(rng.normal(0, 1000, n) * places) / places),
+        "uniform": pd.Series(rng.random(n)),
+        "magnitudes": pd.Series(rng.normal(0, 1, n) * scale),
+        "f32_widened": pd.Series(rng.normal(0, 100, n).astype(np.float32).astype(np.float64)),
+        "float32": pd.Series(np.rint(rng.normal(0, 1000, n) * places) / places, dtype=np.float32),
+        "special": pd.Series(np.resize(special, n)),
+        "int64": pd.Series(rng.integers(np.iinfo(np.int64).min, np.iinfo(np.int64).max, n, endpoint=True)),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the value length kernels against str() and time them.")
+    parser.add_argument("--values", type=int, default=100000, help="values per sample")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    backends = ["numpy"] + (["numba"] if numba_available() else [])
+    failed = False
+    for name, values in sample_values(args.values, args.seed).items():
+        start = time.perf_counter()
+        values.astype(str).str.len()
+        line = f"{name:12} str {time.perf_counter() - start:7.3f} s"
+        for backend in backends:
+            value_lengths(values, backend)  # compile / warm up
+            start = time.perf_counter()
+            value_lengths(values, backend)
+            elapsed = time.perf_counter() - start
+            mismatches = check_value_lengths(values, backend)
+            failed |= not mismatches.empty
+            line += f"  {backend} {elapsed:7.3f} s ({len(mismatches)} mismatches)"
+        print(line)
+    if failed:
+        raise SystemExit("value_lengths disagrees with str(); see the mismatch counts above")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# masks.py
+# Label masks: the columnar counterpart of highlighted workbooks. A mask file
+# has the same columns and rows as the data it labels and one uint8 code per
+# cell: 0 for a normal cell, otherwise an anamoly.LABEL_NAMES code (detection
+# output), any non-zero value (ground truth), or 1 missed / 2 identified /
+# 3 overpredicted (error report). Masks are written as CSV, Parquet or Arrow IPC
+# according to their extension (see readers.py), so large runs never go through
+# openpyxl. The ground truth of a data file is read from its sidecar mask,
+# e.g. Train.parquet -> Train.mask.parquet.
+
+import os
+import numpy as np
+import pandas as pd
+import instrument
+import readers
+
+MASK_SUFFIX = ".mask"
+
+def mask_path(path):
+    """
+    Sidecar mask file of a data file: Train.parquet -> Train.mask.parquet.
+    """
+    base, ext = os.path.splitext(path)
+    return base + MASK_SUFFIX + ext
+
+def _mask_frame(codes, columns):
+    return pd.DataFrame(np.asarray(codes, dtype=np.uint8), columns=[str(col) for col in columns])
+
+@instrument.instrumented("write_mask")
+def write_mask(codes, columns, path):
+    """
+    Write a label code matrix as a mask file.
+
+    Args:
+        codes (np.ndarray): Matrix of codes (0 = normal), one row per data row.
+        columns (list): Column names of the labelled data.
+        path (str): Output file; .csv, .parquet or .arrow/.feather.
+    """
+    readers.write_table(_mask_frame(codes, columns), path)
+
+def read_mask(path):
+    """
+    Read a mask file.
+
+    Returns:
+        tuple: (codes, columns) with codes a uint8 matrix of the data's shape.
+    """
+    df = readers.read_sheet(path)
+    return df.to_numpy(dtype=np.uint8), list(df.columns)
+
+def highlight_layout(flags):
+    """
+    Lays out a data-shaped bool matrix like a highlight matrix read from a
+    workbook: a leading all-False header row, and the first (ID) column dropped.
+
+    Args:
+        flags (np.ndarray): Bool matrix aligned with the data.
+
+    Returns:
+        np.ndarray: 2D bool array.
+    """
+    flags = np.asarray(flags, dtype=bool)[:, 1:]
+    return np.vstack([np.zeros((1, flags.shape[1]), dtype=bool), flags])
+
+def data_layout(matrix):
+    """
+    Inverse of highlight_layout: drops the header row and restores the first
+    column (as zeros), giving a matrix aligned with the data.
+    """
+    matrix = np.asarray(matrix)[1:]
+    return np.hstack([np.zeros((matrix.shape[0], 1), dtype=matrix.dtype), matrix])
+
+def read_highlight_matrix(path):
+    """
+    Read a ground truth mask in the layout of highlights.get_highlight_matrix.
+
+    Returns:
+        np.ndarray: 2D bool array, True where the mask is non-zero.
+    """
+    codes, _ = read_mask(path)
+    return highlight_layout(codes != 0)
+
+class MaskWriter:
+    """
+    Writes a mask file block by block (for the streaming mode in chunked.py).
+    Use as a context manager; Parquet and Arrow need pyarrow.
+
+    Args:
+        path (str): Output file; .csv, .parquet or .arrow/.feather.
+        columns (list): Column names of the labelled data.
+    """
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = [str(col) for col in columns]
+        self.format = readers.file_format(path)
+        if self.format == "xlsx":
+            raise ValueError(f"Masks are written as CSV, Parquet or Arrow, not workbooks: {path}")
+        self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def write(self, codes):
+        """
+        Append the codes of the next block of rows.
+        """
+        frame = _mask_frame(codes, self.columns)
+        if self.format == "csv":
+            if self._writer is None:
+                self._writer = open(self.path, "w", newline="")
+                frame.to_csv(self._writer, index=False)
+            else:
+                frame.to_csv(self._writer, index=False, header=False)
+            return
+        import pyarrow as pa
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        if self._writer is None:
+            if self.format == "parquet":
+                import pyarrow.parquet as pq
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            else:
+                self._writer = pa.ipc.new_file(self.path, table.schema)
+        self._writer.write_table(table)
+
+    def close(self):
+        """
+        Finish the file (an empty mask with just the columns if nothing was written).
+        """
+        if self._writer is None:
+            self.write(np.zeros((0, len(self.columns)), dtype=np.uint8))
+        self._writer.close()
@@ -0,0 +1,214 @@
+# ooxml.py
+# Helpers for patching .xlsx packages in place, shared by errors.py (recolouring
+# the report template) and incremental.py (rewriting changed output rows).
+# Sheet and style parts are located through the workbook relationships, a
+# sheet's <row> elements are streamed through a rewrite function, cells are
+# edited with plain string operations, and the package is copied with only the
+# patched parts replaced. Anything these helpers cannot handle safely raises
+# Unpatchable, and the callers fall back to writing the workbook with openpyxl.
+
+import codecs
+import os
+import posixpath
+import re
+import shutil
+import zipfile
+from xml.etree import ElementTree
+
+# Bytes of sheet XML read at a time while streaming rows
+STREAM_BYTES = 1 << 20
+
+MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+RELS_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PACKAGE_RELS_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+WORKBOOK_RELS = "xl/_rels/workbook.xml.rels"
+ROW_RE = re.compile(r"<row\b[^>]*?(?:/>|>.*?</row>)", re.DOTALL)
+CELL_RE = re.compile(r"<c\b[^>]*?(?:/>|>.*?</c>)", re.DOTALL)
+ROW_NUMBER_RE = re.compile(r'<row\b[^>]*?\sr="(\d+)"')
+CELL_REF_RE = re.compile(r'<c\b[^>]*?\sr="([A-Z]+)\d+"')
+STYLE_RE = re.compile(r'\ss="(\d+)"')
+SPANS_RE = re.compile(r'\sspans="[^"]*"')
+
+class Unpatchable(Exception):
+    """The workbook's XML cannot be patched in place and must be written with openpyxl."""
+
+def resolve_target(zin, rels_path, base, rel_type=None, rel_id=None):
+    """
+    Path of the part a relationship points to.
+
+    Args:
+        zin (zipfile.ZipFile): Open package.
+        rels_path (str): Relationships part to search (e.g. WORKBOOK_RELS).
+        base (str): Directory relative targets are resolved against.
+        rel_type (str, optional): Match the first relationship whose type ends with this.
+        rel_id (str, optional): Match the relationship with this id.
+
+    Returns:
+        str: Part path inside the package.
+    """
+    rels = ElementTree.fromstring(zin.read(rels_path))
+    for rel in rels.findall(f"{{{PACKAGE_RELS_NS}}}Relationship"):
+        if rel.get("Id") == rel_id or (rel_type and rel.get("Type", "").endswith(rel_type)):
+            target = rel.get("Target")
+            return target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join(base, target))
+    raise Unpatchable(rel_id or rel_type)
+
+def sheet_paths(zin, names=None):
+    """
+    Part paths of a workbook's sheets.
+
+    Args:
+        zin (zipfile.ZipFile): Open package.
+        names (list, optional): Sheet names. If None, only the active sheet.
+
+    Returns:
+        dict: Sheet name -> sheet XML path, in tab order.
+    """
+    workbook = ElementTree.fromstring(zin.read("xl/workbook.xml"))
+    sheets = workbook.findall(f"{{{MAIN_NS}}}sheets/{{{MAIN_NS}}}sheet")
+    if names is None:
+        view = workbook.find(f"{{{MAIN_NS}}}bookViews/{{{MAIN_NS}}}workbookView")
+        active = int(view.get("activeTab", 0)) if view is not None else 0
+        if active >= len(sheets):
+            raise Unpatchable("active sheet")
+        names = [sheets[active].get("name")]
+    paths = {}
+    for sheet in sheets:
+        if sheet.get("name") in names:
+            paths[sheet.get("name")] = resolve_target(zin, WORKBOOK_RELS, "xl", rel_id=sheet.get(f"{{{RELS_NS}}}id"))
+    if len(paths) != len(set(names)):
+        raise Unpatchable("sheets missing from the workbook")
+    return paths
+
+def styles_path(zin):
+    """Path of the workbook's styles part."""
+    return resolve_target(zin, WORKBOOK_RELS, "xl", rel_type="/styles")
+
+def solid_fill_style(styles, rgb):
+    """
+    Index of the first cell style with a solid fill of colour rgb (e.g. "FFFF00"),
+    or None if the styles XML has none.
+    """
+    root = ElementTree.fromstring(styles)
+    fill_ids = set()
+    for i, fill in enumerate(root.findall(f"{{{MAIN_NS}}}fills/{{{MAIN_NS}}}fill")):
+        pattern = fill.find(f"{{{MAIN_NS}}}patternFill")
+        color = pattern.find(f"{{{MAIN_NS}}}fgColor") if pattern is not None else None
+        if color is not None and pattern.get("patternType") == "solid" and color.get("rgb", "")[-6:].upper() == rgb:
+            fill_ids.add(str(i))
+    for i, xf in enumerate(root.findall(f"{{{MAIN_NS}}}cellXfs/{{{MAIN_NS}}}xf")):
+        if xf.get("fillId") in fill_ids:
+            return i
+    return None
+
+def set_attribute(start_tag, name, value):
+    """Set (or add) an attribute of an element's start tag."""
+    pattern = re.compile(rf'\s{name}="[^"]*"')
+    if pattern.search(start_tag):
+        return pattern.sub(f' {name}="{value}"', start_tag, count=1)
+    end = -2 if start_tag.endswith("/>") else -1
+    return f'{start_tag[:end]} {name}="{value}"{start_tag[end:]}'
+
+def column_index(letters):
+    # "A" -> 1, "AB" -> 28
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - 64
+    return index
+
+def column_letter(index):
+    # 1 -> "A", 28 -> "AB"
+    letters = ""
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+def row_number(row):
+    """1-based number of a <row> element."""
+    number = ROW_NUMBER_RE.match(row)
+    if number is None:
+        raise Unpatchable("row without a row number")
+    return int(number.group(1))
+
+def split_row(row):
+    """
+    Split a <row> element into its start tag and its cells.
+
+    Returns:
+        tuple: (start tag, list of (1-based column index, cell XML)).
+    """
+    if row.endswith("/>"):
+        start, body = row[:-2] + ">", ""
+    else:
+        start, body = row[:row.index(">") + 1], row[row.index(">") + 1:-len("</row>")]
+    cells = []
+    matched = 0
+    for match in CELL_RE.finditer(body):
+        cell = match.group(0)
+        matched += len(cell)
+        ref = CELL_REF_RE.match(cell)
+        if ref is None:
+            raise Unpatchable("cell without a reference")
+        cells.append((column_index(ref.group(1)), cell))
+    if matched != len(body):
+        raise Unpatchable("unexpected row content")
+    return start, cells
+
+def stream_rows(src, dst, rewrite, append=None):
+    """
+    Copy sheet XML from src to dst, passing every <row> element through rewrite.
+
+    The XML is read STREAM_BYTES at a time, so memory stays constant however
+    large the sheet is.
+
+    Args:
+        src: Binary file object of the sheet XML.
+        dst: Binary file object to write to.
+        rewrite (callable): Row XML -> replacement XML ("" drops the row).
+        append (callable, optional): Called after the last row; the XML it
+            returns is inserted at the end of <sheetData>.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    while True:
+        block = src.read(STREAM_BYTES)
+        buffer += decoder.decode(block, final=not block)
+        parts = []
+        pos = 0
+        for match in ROW_RE.finditer(buffer):
+            parts.append(buffer[pos:match.start()])
+            parts.append(rewrite(match.group(0)))
+            pos = match.end()
+        # A row cut off at the end of the block is completed by the next one
+        buffer = buffer[pos:]
+        dst.write("".join(parts).encode("utf-8"))
+        if not block:
+            break
+    if append is not None:
+        end = buffer.find("</sheetData>")
+        if end < 0:
+            raise Unpatchable("no sheetData end tag")
+        buffer = buffer[:end] + append() + buffer[end:]
+    dst.write(buffer.encode("utf-8"))
+
+def rewrite_package(zin, result_f, rewriters):
+    """
+    Copy every part of a package to a new file, passing the parts named in
+    `rewriters` through their rewriter instead of copying them byte for byte.
+
+    Args:
+        zin (zipfile.ZipFile): Open source package.
+        result_f (str): Path of the new package; removed again if a rewriter
+            raises Unpatchable.
+        rewriters (dict): Part path -> callable(src, dst) on binary file objects.
+    """
+    try:
+        with zipfile.ZipFile(result_f, "w", zipfile.ZIP_DEFLATED) as zout:
+            for info in zin.infolist():
+                with zin.open(info) as src, zout.open(info.filename, "w") as dst:
+                    rewriter = rewriters.get(info.filename, shutil.copyfileobj)
+                    rewriter(src, dst)
+    except Unpatchable:
+        os.remove(result_f)
+        raise
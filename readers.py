@@ -0,0 +1,340 @@
+# readers.py
+# Pluggable input readers for the anomaly detection pipeline.
+# Sheets are parsed with the fastest available engine (calamine if the
+# python-calamine package is installed, otherwise pandas' read-only openpyxl
+# reader) and can be cached on disk, so re-running detection on an unchanged
+# input skips XLSX parsing entirely. CSV, Parquet and Arrow IPC (Feather) files
+# are read and written too, picked by file extension; Parquet and Arrow need
+# the optional pyarrow package. None of these formats touch openpyxl.
+# Several sheets of a workbook can be read with a single parse (read_sheets).
+
+import hashlib
+import io
+import os
+import zipfile
+from xml.etree import ElementTree
+import pandas as pd
+
+def _read_openpyxl(path, sheet_name):
+    return pd.read_excel(path, sheet_name=sheet_name, engine="openpyxl")
+
+def _read_calamine(path, sheet_name):
+    return pd.read_excel(path, sheet_name=sheet_name, engine="calamine")
+
+# Engine name -> function(path, sheet_name) returning a DataFrame; like
+# pd.read_excel, a list of sheet names returns a dict of DataFrames (see read_sheets).
+READERS = {
+    "openpyxl": _read_openpyxl,
+    "calamine": _read_calamine,
+}
+
+# File extension -> table format.
+FORMATS = {
+    ".xlsx": "xlsx",
+    ".xlsm": "xlsx",
+    ".csv": "csv",
+    ".parquet": "parquet",
+    ".arrow": "arrow",
+    ".feather": "arrow",
+}
+# SpreadsheetML namespace of xl/workbook.xml, which lists a workbook's sheets.
+_MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+# Formats read directly on every run; their parse is too cheap to be worth caching.
+UNCACHED_FORMATS = ("parquet", "arrow")
+
+# Strings pandas' Excel and CSV readers read as missing (their default na_values).
+# Text columns of Parquet and Arrow files get the same treatment, so a sheet
+# gives the same frame in every format.
+NA_STRINGS = (
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+)
+
+def _na_strings_to_nan(df):
+    for col in df.columns:
+        if pd.api.types.is_string_dtype(df[col]):
+            df[col] = df[col].mask(df[col].isin(NA_STRINGS))
+    return df
+
+def _read_parquet(source):
+    return _na_strings_to_nan(pd.read_parquet(source))
+
+def _read_arrow(source):
+    return _na_strings_to_nan(pd.read_feather(source))
+
+# Format -> function(path or file object) returning a DataFrame, for the non-workbook formats.
+TABLE_READERS = {
+    "csv": pd.read_csv,
+    "parquet": _read_parquet,
+    "arrow": _read_arrow,
+}
+
+def file_format(path):
+    """
+    Table format of a file, from its extension. Unknown extensions are treated
+    as workbooks, as before other formats were supported.
+
+    Args:
+        path (str): File path.
+
+    Returns:
+        str: 'xlsx', 'csv', 'parquet' or 'arrow'.
+    """
+    return FORMATS.get(os.path.splitext(path)[1].lower(), "xlsx")
+
+def is_workbook(path):
+    """
+    True if path is an Excel workbook (cells carry highlight fills), False for
+    the columnar formats (labels live in a separate mask file, see masks.py).
+    """
+    return file_format(path) == "xlsx"
+
+def register_reader(name, reader):
+    """
+    Register an additional reader engine.
+
+    Args:
+        name (str): Engine name, as passed to read_sheet(engine=...).
+        reader (callable): Function (path, sheet_name) -> pd.DataFrame; given a list
+            of sheet names it returns a dict of DataFrames, as pd.read_excel does.
+    """
+    READERS[name] = reader
+
+def default_engine():
+    """
+    Returns:
+        str: 'calamine' if python-calamine is installed, else 'openpyxl'.
+    """
+    try:
+        import python_calamine  # noqa: F401
+    except ImportError:
+        return "openpyxl"
+    return "calamine"
+
+def file_key(path, sheet_name=None):
+    """
+    Cache key for a sheet: hash of the file contents, its mtime and the sheet name.
+
+    Args:
+        path (str): Path to the input file.
+        sheet_name (str or int, optional): Sheet the key refers to.
+
+    Returns:
+        str: Hex digest identifying this version of the sheet.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    digest.update(f"{os.stat(path).st_mtime_ns}:{sheet_name}".encode())
+    return digest.hexdigest()[:32]
+
+def read_sheet(path, sheet_name=None, engine=None, cache_dir=None):
+    """
+    Read one sheet (or CSV, Parquet or Arrow file) into a DataFrame.
+
+    When `cache_dir` is set, the parsed frame is stored there as a pickle keyed
+    by file_key; later reads of the same unchanged file load it directly. Pickle
+    is used rather than Parquet/Feather because it round-trips the mixed-type
+    object columns this pipeline is designed to flag, with identical dtypes.
+    Parquet and Arrow inputs are never cached. Every format is read whole; see
+    iter_csv_chunks and iter_table_chunks (used by chunked.py) for files that do
+    not fit in memory. The cache is never pruned, and
+    unpickling runs code, so use a private directory that only this tool writes.
+
+    Args:
+        path (str): Path to the input file; the format is taken from its extension.
+        sheet_name (str or int, optional): Sheet to read from a workbook. If None, reads the first sheet.
+        engine (str, optional): Name of a registered reader. If None, uses default_engine().
+        cache_dir (str, optional): Directory for the parsed-sheet cache. None disables caching.
+
+    Returns:
+        pd.DataFrame: Sheet contents, as pd.read_excel would return them.
+    """
+    fmt = file_format(path)
+    if fmt in UNCACHED_FORMATS:
+        return TABLE_READERS[fmt](path)
+    if sheet_name is None:
+        sheet_name = 0
+    cache_file = None
+    if cache_dir:
+        cache_file = os.path.join(cache_dir, file_key(path, sheet_name) + ".pkl")
+        if os.path.exists(cache_file):
+            return pd.read_pickle(cache_file)
+    if fmt == "xlsx":
+        df = READERS[engine or default_engine()](path, sheet_name)
+    else:
+        df = TABLE_READERS[fmt](path)
+    if cache_file:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_file = cache_file + ".tmp"
+        df.to_pickle(tmp_file)
+        os.replace(tmp_file, cache_file)
+    return df
+
+def sheet_names(path):
+    """
+    Names of a workbook's sheets, in tab order, read from its sheet list only
+    (no sheet is parsed).
+
+    Args:
+        path (str): Path to the workbook.
+
+    Returns:
+        list: Sheet names.
+    """
+    with zipfile.ZipFile(path) as zin:
+        workbook = ElementTree.fromstring(zin.read("xl/workbook.xml"))
+    return [sheet.get("name") for sheet in workbook.iter(f"{{{_MAIN_NS}}}sheet")]
+
+def read_sheets(path, names=None, engine=None, cache_dir=None):
+    """
+    Read several sheets of a workbook with a single parse.
+
+    Sheets already in the cache (see read_sheet) are loaded from it; the others
+    are parsed together in one call of the reader engine and cached one by one.
+
+    Args:
+        path (str): Path to the workbook.
+        names (list, optional): Sheets to read. If None, reads every sheet.
+        engine (str, optional): Name of a registered reader. If None, uses default_engine().
+        cache_dir (str, optional): Directory for the parsed-sheet cache. None disables caching.
+
+    Returns:
+        dict: Sheet name -> pd.DataFrame, in the order of names.
+    """
+    if not is_workbook(path):
+        raise ValueError(f"Only workbooks have several sheets: {path}")
+    names = sheet_names(path) if names is None else list(names)
+    frames = {}
+    cache_files = {}
+    if cache_dir:
+        for name in names:
+            cache_files[name] = os.path.join(cache_dir, file_key(path, name) + ".pkl")
+            if os.path.exists(cache_files[name]):
+                frames[name] = pd.read_pickle(cache_files[name])
+    missing = [name for name in names if name not in frames]
+    if missing:
+        parsed = READERS[engine or default_engine()](path, missing)
+        for name in missing:
+            frames[name] = parsed[name]
+            if cache_dir:
+                os.makedirs(cache_dir, exist_ok=True)
+                tmp_file = cache_files[name] + ".tmp"
+                parsed[name].to_pickle(tmp_file)
+                os.replace(tmp_file, cache_files[name])
+    return {name: frames[name] for name in names}
+
+def read_bytes(data, file_format="xlsx", sheet_name=None, engine=None):
+    """
+    Read an in-memory file (e.g. an upload) into a DataFrame.
+
+    Args:
+        data (bytes): File contents.
+        file_format (str): 'xlsx', 'csv', 'parquet' or 'arrow'.
+        sheet_name (str or int, optional): Sheet to read from a workbook. If None, reads the first sheet.
+        engine (str, optional): Name of a registered workbook reader. If None, uses default_engine().
+
+    Returns:
+        pd.DataFrame: File contents.
+    """
+    if file_format in TABLE_READERS:
+        return TABLE_READERS[file_format](io.BytesIO(data))
+    if file_format != "xlsx":
+        raise ValueError(f"Unsupported file format {file_format!r}; expected 'xlsx', 'csv', 'parquet' or 'arrow'")
+    return READERS[engine or default_engine()](io.BytesIO(data), 0 if sheet_name is None else sheet_name)
+
+def iter_csv_chunks(path, chunk_rows):
+    """
+    Stream a CSV file as object-dtype DataFrames of at most `chunk_rows` rows.
+
+    Each chunk's values are parsed like pd.read_csv would (numbers as int or
+    float, NA strings as NaN) and then cast to object, because per-chunk dtype
+    inference differs between chunks (see chunked.normalize_chunk).
+
+    Yields:
+        pd.DataFrame: Next chunk, indexed by row position in the file.
+    """
+    with pd.read_csv(path, chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            yield chunk.astype(object)
+
+def _arrow_batches(path, chunk_rows):
+    import pyarrow as pa
+    with pa.memory_map(path) as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            # Record batches are sized by the writer; slice them to chunk_rows
+            batch = reader.get_batch(i)
+            for offset in range(0, batch.num_rows, chunk_rows):
+                yield batch.slice(offset, chunk_rows)
+
+def iter_table_chunks(path, chunk_rows):
+    """
+    Stream a Parquet or Arrow file as object-dtype DataFrames of at most
+    `chunk_rows` rows, read one record batch at a time.
+
+    Values are converted like read_sheet converts them (NA strings as NaN) and
+    then cast to object, as in iter_csv_chunks.
+
+    Yields:
+        pd.DataFrame: Next chunk, indexed by row position in the file.
+    """
+    if file_format(path) == "parquet":
+        import pyarrow.parquet as pq
+        batches = pq.ParquetFile(path).iter_batches(batch_size=chunk_rows)
+    else:
+        batches = _arrow_batches(path, chunk_rows)
+    start = 0
+    for batch in batches:
+        chunk = _na_strings_to_nan(batch.to_pandas()).astype(object)
+        chunk.index = pd.RangeIndex(start, start + len(chunk))
+        start += len(chunk)
+        yield chunk
+
+def _columnar_frame(df):
+    # Parquet and Arrow columns hold a single type: store mixed object columns as text
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype == object and df[col].dropna().map(type).nunique() > 1:
+            df[col] = df[col].map(lambda v: v if pd.isna(v) else str(v))
+    df.columns = [str(col) for col in df.columns]
+    return df.reset_index(drop=True)
+
+def read_columns(path):
+    """
+    Column names of a file, read from its header (or schema) only.
+    """
+    fmt = file_format(path)
+    if fmt == "csv":
+        return list(pd.read_csv(path, nrows=0).columns)
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        return pq.read_schema(path).names
+    if fmt == "arrow":
+        import pyarrow as pa
+        with pa.memory_map(path) as source:
+            return pa.ipc.open_file(source).schema.names
+    return list(pd.read_excel(path, nrows=0, engine=default_engine()).columns)
+
+def write_table(df, path):
+    """
+    Write a DataFrame as CSV, Parquet or Arrow IPC, picked by the file extension.
+
+    Object columns holding mixed types are written as text to Parquet and Arrow,
+    whose columns have a single type. Use anamoly.replace_and_highlight (or
+    synthetic.write_ground_truth) for workbooks.
+
+    Args:
+        df (pd.DataFrame): Data to write.
+        path (str): Output file path.
+    """
+    fmt = file_format(path)
+    if fmt == "csv":
+        df.to_csv(path, index=False)
+    elif fmt == "parquet":
+        _columnar_frame(df).to_parquet(path, index=False)
+    elif fmt == "arrow":
+        _columnar_frame(df).to_feather(path)
+    else:
+        raise ValueError(f"write_table does not write workbooks: {path}")
@@ -0,0 +1,410 @@
+# service.py
+# Local HTTP detection service. One long-running process keeps a pool of warm
+# worker processes (pandas and scikit-learn imported once, saved models loaded
+# once per worker and reloaded only when their file changes) and runs uploaded
+# XLSX/CSV files through the detection pipeline. Jobs queue on a bounded pool:
+# when all workers are busy and QUEUE_SIZE jobs are already waiting, new
+# requests are refused with 503 and a Retry-After header instead of piling up.
+#
+# Endpoints (the request body is the raw file; its format comes from ?filename=
+# or a text/csv Content-Type, and defaults to XLSX):
+#   GET  /health                  worker count, queued jobs and available models
+#   POST /detect                  labels as JSON, or ?format=xlsx for the highlighted workbook
+#                                 (?format=csv/parquet/arrow for a label mask file, see masks.py)
+#        ?model=NAME              score with MODEL_DIR/NAME.joblib instead of refitting
+#        ?policy=union            combine policy (see anamoly.COMBINE_POLICIES)
+#        ?rules_only=1            skip the Isolation Forest
+#        ?filename=data.parquet   original file name (used to pick the reader)
+#   POST /models/NAME             fit a model on the upload and save it as MODEL_DIR/NAME.joblib
+#
+# Usage:
+#   python service.py --workers 4 --model-dir models
+#   curl --data-binary @Train.xlsx "http://127.0.0.1:8765/models/train"
+#   curl --data-binary @Test.xlsx "http://127.0.0.1:8765/detect?model=train"
+#   curl --data-binary @Test.xlsx "http://127.0.0.1:8765/detect?format=xlsx" -o Test_output.xlsx
+
+import argparse
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError, wait
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import numpy as np
+import anamoly
+import readers
+
+HOST = "127.0.0.1"
+PORT = 8765
+# Directory of saved models (NAME.joblib) that requests can select with ?model=NAME.
+MODEL_DIR = "models"
+MODEL_SUFFIX = ".joblib"
+# Jobs allowed to wait for a free worker; further requests get 503.
+QUEUE_SIZE = 16
+MAX_UPLOAD_BYTES = 200 << 20
+# Bytes read at a time while dropping the body of a refused upload
+DISCARD_CHUNK_BYTES = 1 << 16
+# Seconds a request waits for its job before getting 504 (the job itself keeps running).
+REQUEST_TIMEOUT = 300
+# Response content type of each output format other than JSON.
+CONTENT_TYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file",
+}
+
+_MODEL_NAME_RE = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+# Per worker process: model name -> (file mtime, model)
+_models = {}
+_model_dir = MODEL_DIR
+
+def _init_worker(model_dir, rules_only):
+    global _model_dir
+    _model_dir = model_dir
+    if not rules_only:
+        # Import scikit-learn up front so the first request does not pay for it
+        from sklearn.ensemble import IsolationForest  # noqa: F401
+    if os.path.isdir(model_dir):
+        for name in available_models(model_dir):
+            _get_model(name)
+
+def _warm_up():
+    return os.getpid()
+
+def available_models(model_dir=MODEL_DIR):
+    """
+    Returns:
+        list: Sorted names of the models saved in model_dir.
+    """
+    if not os.path.isdir(model_dir):
+        return []
+    return sorted(f[:-len(MODEL_SUFFIX)] for f in os.listdir(model_dir) if f.endswith(MODEL_SUFFIX))
+
+def _model_path(name):
+    if not _MODEL_NAME_RE.match(name):
+        raise ValueError(f"Invalid model name {name!r}")
+    return os.path.join(_model_dir, name + MODEL_SUFFIX)
+
+def _get_model(name):
+    # Cached per worker; a model file replaced by a later fit is reloaded
+    path = _model_path(name)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        raise LookupError(f"Unknown model {name!r}") from None
+    cached = _models.get(name)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, anamoly.load_model(path))
+        _models[name] = cached
+    return cached[1]
+
+def _read_upload(data, file_format):
+    try:
+        return readers.read_bytes(data, file_format)
+    except Exception as exc:
+        raise ValueError(f"Could not read the upload as {file_format}: {exc}") from exc
+
+def anomaly_records(df, anomalies):
+    """
+    List the flagged cells of a label matrix.
+
+    Args:
+        df (pd.DataFrame): Data the labels refer to.
+        anomalies (np.ndarray): uint8 label matrix.
+
+    Returns:
+        list: One dict per flagged cell with 'row' (0-based data row), 'column' and 'label'.
+    """
+    columns = [str(col) for col in df.columns]
+    rows, cols = np.nonzero(anomalies)
+    labels = anamoly.LABEL_NAMES[anomalies[rows, cols]]
+    return [
+        {"row": int(i), "column": columns[j], "label": label}
+        for i, j, label in zip(rows.tolist(), cols.tolist(), labels)
+    ]
+
+def detect_job(data, file_format="xlsx", model_name=None, policy=anamoly.COMBINE_POLICY,
+               rules_only=False, output_format="json"):
+    """
+    Detect anomalies in an uploaded file (runs in a worker process).
+
+    Args:
+        data (bytes): Uploaded XLSX or CSV file.
+        file_format (str): 'xlsx', 'csv', 'parquet' or 'arrow'.
+        model_name (str, optional): Saved model to score with; if None, the forest is fitted on the upload.
+        policy (str): Combine policy (see anamoly.COMBINE_POLICIES).
+        rules_only (bool): Skip the Isolation Forest.
+        output_format (str): 'json', 'xlsx', or a mask format ('csv', 'parquet', 'arrow').
+
+    Returns:
+        dict or bytes: JSON-serialisable summary and flagged cells, or the output file.
+    """
+    start = time.perf_counter()
+    if policy not in anamoly.COMBINE_POLICIES:
+        raise ValueError(f"Unknown combine policy {policy!r}; expected one of {sorted(anamoly.COMBINE_POLICIES)}")
+    if rules_only and model_name:
+        raise ValueError("A rules-only run does not use a model.")
+    model = _get_model(model_name) if model_name else None
+    df = _read_upload(data, file_format)
+    anomalies = anamoly.detect_anomalies(df, model, workers=1, policy=policy, rules_only=rules_only)
+    if output_format != "json":
+        with tempfile.TemporaryDirectory() as tmp:
+            output_file = os.path.join(tmp, "output." + output_format)
+            anamoly.write_output(df, anomalies, output_file)
+            with open(output_file, "rb") as f:
+                return f.read()
+    codes, counts = np.unique(anomalies[anomalies != anamoly.Label.NONE], return_counts=True)
+    return {
+        "rows": len(df),
+        "columns": [str(col) for col in df.columns],
+        "counts": {anamoly.LABEL_NAMES[code]: int(n) for code, n in zip(codes, counts)},
+        "anomalies": anomaly_records(df, anomalies),
+        "seconds": round(time.perf_counter() - start, 4),
+    }
+
+def fit_job(data, file_format, model_name):
+    """
+    Fit a model on an uploaded reference file and save it (runs in a worker process).
+
+    Returns:
+        dict: The model's name, columns and column types.
+    """
+    path = _model_path(model_name)
+    df = _read_upload(data, file_format)
+    types = anamoly.infer_column_types(df)
+    model = anamoly.fit_model(df, types)
+    os.makedirs(_model_dir, exist_ok=True)
+    tmp_file = path + ".tmp"
+    anamoly.save_model(model, tmp_file)
+    os.replace(tmp_file, path)
+    return {"model": model_name, "columns": [str(col) for col in df.columns],
+            "types": {str(col): kind for col, kind in types.items()}}
+
+class DetectionService:
+    """
+    Bounded pool of warm worker processes.
+
+    At most `workers` jobs run at once and at most `queue_size` more wait for a
+    worker; reserve() refuses further jobs instead of queueing them. If a worker
+    process dies, the broken pool is replaced by a new one.
+
+    Args:
+        workers (int): Worker processes.
+        queue_size (int): Jobs allowed to wait for a free worker.
+        model_dir (str): Directory of saved models.
+        rules_only (bool): Run every request rules-only; workers never import scikit-learn.
+    """
+    def __init__(self, workers=1, queue_size=QUEUE_SIZE, model_dir=MODEL_DIR, rules_only=False):
+        self.workers = workers
+        self.model_dir = model_dir
+        self.rules_only = rules_only
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._pool_lock = threading.Lock()
+        self.pool = self._start_pool()
+
+    def _start_pool(self):
+        pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                   initargs=(self.model_dir, self.rules_only))
+        # Start every worker now rather than on the first requests
+        wait([pool.submit(_warm_up) for _ in range(self.workers)])
+        return pool
+
+    def restart_pool(self, broken):
+        """
+        Replace the pool `broken` (one of whose workers died) with a new one.
+        Does nothing if another thread has already replaced it.
+        """
+        with self._pool_lock:
+            if self.pool is broken:
+                broken.shutdown(wait=False, cancel_futures=True)
+                self.pool = self._start_pool()
+
+    @property
+    def pending(self):
+        """Jobs running or waiting for a worker."""
+        return self._pending
+
+    def reserve(self):
+        """
+        Take a job slot, before the job's upload is read.
+
+        Returns:
+            bool: False if the queue is full. A reserved slot is freed when the
+            job submitted in it finishes, or by release() if none is.
+        """
+        if not self._slots.acquire(blocking=False):
+            return False
+        with self._lock:
+            self._pending += 1
+        return True
+
+    def release(self):
+        """Free a slot taken with reserve()."""
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def submit(self, func, *args):
+        """
+        Queue a job in a slot taken with reserve(); the slot is freed if the job
+        cannot be queued.
+
+        Returns:
+            tuple: (pool, future): the pool the job went to, to pass to
+            restart_pool() if the future raises BrokenProcessPool, and the job's future.
+        """
+        try:
+            pool = self.pool
+            try:
+                future = pool.submit(func, *args)
+            except BrokenProcessPool:
+                self.restart_pool(pool)
+                pool = self.pool
+                future = pool.submit(func, *args)
+        except BaseException:
+            self.release()
+            raise
+        future.add_done_callback(lambda _: self.release())
+        return pool, future
+
+    def shutdown(self):
+        self.pool.shutdown(cancel_futures=True)
+
+class DetectionHandler(BaseHTTPRequestHandler):
+    """
+    HTTP front end; self.server.service is the DetectionService.
+    """
+    server_version = "AnomalyDetection/1.0"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path != "/health":
+            return self._send_json(404, {"error": f"Not found: {url.path}"})
+        service = self.server.service
+        self._send_json(200, {
+            "status": "ok",
+            "workers": service.workers,
+            "pending": service.pending,
+            "models": available_models(service.model_dir),
+        })
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if url.path == "/detect":
+            output_format = query.get("format", "json")
+            if output_format != "json" and output_format not in CONTENT_TYPES:
+                return self._send_json(400, {"error": f"Unknown format {output_format!r}; expected json or one of {sorted(CONTENT_TYPES)}"})
+            rules_only = self.server.service.rules_only or query.get("rules_only", "0").lower() in ("1", "true", "yes")
+            args = (query.get("model"), query.get("policy", anamoly.COMBINE_POLICY), rules_only, output_format)
+            self._run(detect_job, query, *args)
+        elif url.path.startswith("/models/"):
+            if self.server.service.rules_only:
+                return self._send_json(400, {"error": "The service runs rules-only; models cannot be fitted."})
+            self._run(fit_job, query, url.path[len("/models/"):])
+        else:
+            self._send_json(404, {"error": f"Not found: {url.path}"})
+
+    def _run(self, func, query, *args):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0:
+            return self._send_json(400, {"error": "Empty upload; send the file as the request body."})
+        if length > MAX_UPLOAD_BYTES:
+            return self._send_json(413, {"error": f"Upload larger than {MAX_UPLOAD_BYTES} bytes."})
+        service = self.server.service
+        # Take a slot before reading the body, so refused uploads are never held in memory
+        if not service.reserve():
+            self._send_json(503, {"error": "Too many queued jobs; retry later."}, {"Retry-After": "1"})
+            return self._discard_body(length)
+        try:
+            data = self.rfile.read(length)
+            filename = query.get("filename", "")
+            if filename:
+                file_format = readers.file_format(filename)
+            else:
+                file_format = "csv" if "csv" in self.headers.get("Content-Type", "") else "xlsx"
+        except BaseException:
+            service.release()
+            raise
+        pool, future = service.submit(func, data, file_format, *args)
+        try:
+            result = future.result(timeout=REQUEST_TIMEOUT)
+        except BrokenProcessPool:
+            # Only this job's pool: another request may already have replaced it
+            service.restart_pool(pool)
+            return self._send_json(503, {"error": "A worker process died; retry the request."}, {"Retry-After": "1"})
+        except TimeoutError:
+            return self._send_json(504, {"error": f"Job did not finish within {REQUEST_TIMEOUT} s."})
+        except ValueError as exc:
+            return self._send_json(400, {"error": str(exc)})
+        except LookupError as exc:
+            return self._send_json(404, {"error": str(exc)})
+        except Exception as exc:
+            return self._send_json(500, {"error": f"{type(exc).__name__}: {exc}"})
+        if isinstance(result, bytes):
+            self._send(200, result, CONTENT_TYPES[query["format"]])
+        else:
+            self._send_json(200, result)
+
+    def _discard_body(self, length):
+        # Read (and drop) the unread upload, so the client gets the response
+        # instead of a connection reset
+        while length > 0:
+            chunk = self.rfile.read(min(length, DISCARD_CHUNK_BYTES))
+            if not chunk:
+                break
+            length -= len(chunk)
+
+    def _send_json(self, status, payload, headers=None):
+        self._send(status, json.dumps(payload).encode("utf-8"), "application/json", headers)
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+def make_server(service, host=HOST, port=PORT):
+    """
+    Create (but do not start) the HTTP server for a DetectionService.
+
+    Returns:
+        ThreadingHTTPServer: Call serve_forever() to start handling requests.
+    """
+    server = ThreadingHTTPServer((host, port), DetectionHandler)
+    server.service = service
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve anomaly detection over HTTP.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=1, help="worker processes")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE, help="jobs allowed to wait for a worker")
+    parser.add_argument("--model-dir", default=MODEL_DIR, help="directory of saved models")
+    parser.add_argument("--rules-only", action="store_true", help="run every request rules-only (scikit-learn is not imported)")
+    args = parser.parse_args()
+    service = DetectionService(args.workers, args.queue_size, args.model_dir, args.rules_only)
+    server = make_server(service, args.host, args.port)
+    print(f"Serving on http://{args.host}:{args.port} with {args.workers} worker(s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+if __name__ == "__main__":
+    main()
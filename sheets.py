@@ -0,0 +1,143 @@
+# sheets.py
+# Multi-sheet mode: runs anomaly detection on every sheet of a workbook (or a
+# selected list of sheets) in one run. The workbook is parsed once, the sheets
+# are detected concurrently in a process pool forked from this interpreter, and
+# the results go into one highlighted output workbook (one sheet per input
+# sheet) and one missed/identified/overpredicted report, with per-sheet and
+# combined metrics.
+#
+# Usage:
+#   python sheets.py Vendor.xlsx                      # every sheet
+#   python sheets.py Vendor.xlsx --sheets "Jan,Feb" --workers 4
+#   python sheets.py Vendor.xlsx --rules-only         # no Isolation Forest, scikit-learn is not loaded
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import anamoly
+import instrument
+import readers
+
+_frames = {}
+_model = None
+_policy = anamoly.COMBINE_POLICY
+_rules_only = False
+
+def _init_worker(frames, model, policy, rules_only):
+    global _frames, _model, _policy, _rules_only
+    _frames, _model, _policy, _rules_only = frames, model, policy, rules_only
+
+def _detect_sheet(name):
+    return anamoly.detect_anomalies(_frames[name], _model, workers=1, policy=_policy, rules_only=_rules_only)
+
+def detect_sheets(frames, model=None, workers=None, policy=anamoly.COMBINE_POLICY, rules_only=False):
+    """
+    Detect anomalies in several sheets concurrently, one sheet per task.
+
+    The frames are handed to the worker processes when the pool starts (inherited,
+    not pickled, where processes are forked); each task only sends back its
+    sheet's label matrix.
+
+    Args:
+        frames (dict): Sheet name -> DataFrame.
+        model (dict, optional): Pre-fitted model applied to every sheet (see
+            anamoly.fit_model); every sheet must then have its columns. If None,
+            each sheet gets its own Isolation Forest.
+        workers (int, optional): Number of processes. Defaults to the CPU count;
+            1 detects the sheets one after another in this process.
+        policy (str): How rule and forest labels are merged (see anamoly.COMBINE_POLICIES).
+        rules_only (bool): Skip the Isolation Forest (see anamoly.detect_anomalies).
+
+    Returns:
+        dict: Sheet name -> uint8 label matrix, in the order of frames.
+    """
+    workers = min(workers or os.cpu_count() or 1, len(frames))
+    if workers <= 1:
+        _init_worker(frames, model, policy, rules_only)
+        try:
+            return {name: _detect_sheet(name) for name in frames}
+        finally:
+            _init_worker({}, None, anamoly.COMBINE_POLICY, False)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(frames, model, policy, rules_only)) as pool:
+        return dict(zip(frames, pool.map(_detect_sheet, frames)))
+
+def detect_workbook(input_file, output_file, result_file, sheet_names=None, model=None, workers=None,
+                    read_cache_dir=None, policy=anamoly.COMBINE_POLICY, rules_only=False,
+                    verbose=True):
+    """
+    Run detection and evaluation on several sheets of one workbook.
+
+    The selected sheets are parsed with one read of the workbook (see
+    readers.read_sheets) and detected in parallel (see detect_sheets). The
+    output workbook, written in a background thread, gets one highlighted sheet
+    per input sheet; the report is the input workbook with every selected
+    sheet recoloured (see evaluation.evaluate_sheet_predictions). Sheets without
+    any columns are skipped.
+
+    Args:
+        input_file (str): Path to the input workbook; its highlights are the ground truth.
+        output_file (str): Path to the output Excel file.
+        result_file (str): Path to the missed/identified/overpredicted Excel file.
+        sheet_names (list, optional): Sheets to process. If None, processes every sheet.
+        model (dict, optional): Pre-fitted model applied to every sheet (see detect_sheets).
+        workers (int, optional): Processes detecting sheets. Defaults to the CPU count.
+        read_cache_dir (str, optional): Parsed-sheet and ground truth cache directory. None disables it.
+        policy (str): How rule and forest labels are merged (see anamoly.COMBINE_POLICIES).
+        rules_only (bool): Skip the Isolation Forest; scikit-learn is never imported.
+        verbose (bool): Print the per-sheet and combined metrics.
+
+    Returns:
+        tuple: (summary, tables) from evaluation.evaluate_sheet_predictions.
+    """
+    import evaluation
+    if rules_only and model is not None:
+        raise ValueError("A rules-only run does not use a model.")
+    if not readers.is_workbook(input_file) or not readers.is_workbook(output_file):
+        raise ValueError("Multi-sheet mode reads and writes workbooks (.xlsx).")
+    if sheet_names is not None:
+        unknown = sorted(set(sheet_names) - set(readers.sheet_names(input_file)))
+        if unknown:
+            raise ValueError(f"Sheets not found in {input_file}: {unknown}")
+    with instrument.stage("read_sheets") as record:
+        frames = readers.read_sheets(input_file, sheet_names, cache_dir=read_cache_dir)
+        record.update(rows=sum(len(df) for df in frames.values()), cells=sum(df.size for df in frames.values()))
+    for name in [name for name, df in frames.items() if df.shape[1] == 0]:
+        if verbose:
+            print(f"Skipping empty sheet {name!r}")
+        del frames[name]
+    if not frames:
+        raise ValueError(f"No sheet with data to process in {input_file}")
+    with instrument.stage("detect_sheets") as record:
+        anomalies = detect_sheets(frames, model, workers, policy, rules_only)
+        record.update(rows=sum(len(df) for df in frames.values()), cells=sum(df.size for df in frames.values()))
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        write = pool.submit(anamoly.replace_and_highlight_sheets, frames, anomalies, output_file)
+        results = evaluation.evaluate_sheet_predictions(input_file, anomalies, result_file, verbose=verbose,
+                                                        cache_dir=read_cache_dir)
+        write.result()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Run anomaly detection on several sheets of a workbook.")
+    parser.add_argument("input", help="input workbook (its highlighted cells are the ground truth)")
+    parser.add_argument("--sheets", type=anamoly.parse_sheets, default=anamoly.ALL_SHEETS,
+                        help='"all" (default) or comma-separated sheet names')
+    parser.add_argument("--workers", type=int, default=None, help="number of processes (default: CPU count)")
+    parser.add_argument("--model", default=None, help="saved model to score every sheet with instead of refitting")
+    parser.add_argument("--rules-only", action="store_true", help="skip the Isolation Forest (scikit-learn is not imported)")
+    args = parser.parse_args()
+    if args.model and not os.path.exists(args.model):
+        parser.error(f"model file not found: {args.model}")
+    if args.model and args.rules_only:
+        parser.error("--model cannot be combined with --rules-only")
+    base = os.path.splitext(args.input)[0]
+    detect_workbook(
+        args.input, base + "_output.xlsx", base + "_missed_and_identified.xlsx",
+        None if args.sheets == anamoly.ALL_SHEETS else args.sheets,
+        model=anamoly.load_model(args.model) if args.model else None,
+        workers=args.workers, rules_only=args.rules_only,
+    )
+
+if __name__ == "__main__":
+    main()
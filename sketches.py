@@ -0,0 +1,121 @@
+# sketches.py
+# Small streaming summaries used when the data is seen one chunk at a time:
+# a KLL-style quantile sketch for the out_of_range bounds and an integer
+# histogram of value lengths for the len_incon mode. Both can be merged, so
+# chunks or workers can summarise their part of a column independently.
+
+import numpy as np
+import pandas as pd
+
+QUANTILE_SKETCH_K = 8192
+
+class QuantileSketch:
+    """
+    KLL-style streaming quantile sketch over floats.
+
+    Values are buffered in level 0; whenever a level grows past its capacity it
+    is sorted and every other item is promoted to the next level with twice the
+    weight. Memory is O(k) regardless of how many values are added, and results
+    are exact (pandas' linear interpolation) while no compaction has happened.
+
+    Args:
+        k (int): Capacity of the top level; larger is more accurate.
+        seed (int): Seed for the random compaction offsets.
+    """
+    def __init__(self, k=QUANTILE_SKETCH_K, seed=42):
+        self.k = k
+        self.count = 0
+        self._levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, values):
+        """
+        Add values (NaN values are ignored).
+        """
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        self.count += len(values)
+        self._levels[0] = np.concatenate([self._levels[0], values])
+        self._compress()
+
+    def merge(self, other):
+        """
+        Add all values summarised by another sketch (built with the same k).
+        """
+        if other.k != self.k:
+            raise ValueError("Cannot merge quantile sketches with different k.")
+        for h, level in enumerate(other._levels):
+            if h == len(self._levels):
+                self._levels.append(np.empty(0))
+            self._levels[h] = np.concatenate([self._levels[h], level])
+        self.count += other.count
+        self._compress()
+
+    def quantile(self, q):
+        """
+        Estimate the q-quantile (0 <= q <= 1); NaN if the sketch is empty.
+        """
+        if self.count == 0:
+            return np.nan
+        values = np.concatenate(self._levels)
+        weights = np.concatenate([np.full(len(level), 2 ** h) for h, level in enumerate(self._levels)])
+        order = np.argsort(values, kind='stable')
+        values, weights = values[order], weights[order]
+        # Centre rank of each item's block, so unit weights give ranks 0..n-1
+        positions = np.cumsum(weights) - (weights + 1) / 2
+        return float(np.interp(q * (self.count - 1), positions, values))
+
+    def _capacity(self, h):
+        depth = len(self._levels) - h - 1
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compress(self):
+        h = 0
+        while h < len(self._levels):
+            level = self._levels[h]
+            if len(level) <= self._capacity(h):
+                h += 1
+                continue
+            if h + 1 == len(self._levels):
+                self._levels.append(np.empty(0))
+            level = np.sort(level)
+            # An odd item out stays at this level
+            keep, level = level[:len(level) % 2], level[len(level) % 2:]
+            promoted = level[self._rng.integers(2)::2]
+            self._levels[h] = keep
+            self._levels[h + 1] = np.concatenate([self._levels[h + 1], promoted])
+            h = 0
+
+class LengthHistogram:
+    """
+    Exact histogram of small non-negative integers (value lengths).
+    """
+    def __init__(self):
+        self._counts = np.zeros(0, dtype=np.int64)
+
+    def update(self, lengths):
+        """
+        Add an array of lengths.
+        """
+        self._add(np.bincount(np.asarray(lengths, dtype=np.int64).ravel()))
+
+    def merge(self, other):
+        """
+        Add the counts of another histogram.
+        """
+        self._add(other._counts.copy())
+
+    def _add(self, counts):
+        if len(counts) > len(self._counts):
+            counts[:len(self._counts)] += self._counts
+            self._counts = counts
+        else:
+            self._counts[:len(counts)] += counts
+
+    def counts(self):
+        """
+        Returns:
+            pd.Series: Count per observed length, indexed by length.
+        """
+        lengths = np.flatnonzero(self._counts)
+        return pd.Series(self._counts[lengths], index=lengths)
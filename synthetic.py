@@ -0,0 +1,157 @@
+# synthetic.py
+# Generates synthetic sheets shaped like Train.xlsx for benchmarking: an ID
+# column followed by integer, float, date and category columns, with a chosen
+# share of injected anomalies (missing "NULL" values, stray text, wrong-length
+# integers and out-of-range numbers). The ground truth can be written as a
+# highlighted input workbook, exactly like the hand-labelled files, or as a
+# CSV/Parquet/Arrow data file with a sidecar mask file (see masks.py).
+#
+# Usage:
+#   python synthetic.py Synthetic.xlsx --rows 100000 --mix int=4,float=3,date=1,category=2
+#   python synthetic.py Synthetic.parquet --rows 1000000   # also writes Synthetic.mask.parquet
+
+import argparse
+import numpy as np
+import pandas as pd
+import anamoly
+import masks
+import readers
+
+# Default number of columns of each kind (after the ID column).
+DEFAULT_MIX = {"int": 4, "float": 3, "date": 1, "category": 2}
+DEFAULT_ANOMALY_RATE = 0.02
+# Anomalies injected into each column kind, chosen uniformly per anomalous cell.
+ANOMALY_KINDS = {
+    "int": ("missing", "text", "length", "range"),
+    "float": ("missing", "text", "range"),
+    "date": ("missing", "text"),
+    "category": ("missing",),
+}
+MISSING_VALUE = "NULL"
+CATEGORIES = np.array(["alpha", "beta", "gamma", "delta", "epsilon"], dtype=object)
+_TEXT_CHARS = np.array(list("abcdefghijklmnopqrstuvwxyz0123456789"))
+
+def parse_mix(text):
+    """
+    Parse a column mix such as "int=4,float=3,date=1,category=2".
+
+    Returns:
+        dict: Column kind -> number of columns.
+    """
+    mix = {}
+    for part in text.split(","):
+        kind, _, count = part.partition("=")
+        kind = kind.strip()
+        if kind not in ANOMALY_KINDS:
+            raise ValueError(f"Unknown column kind {kind!r}; expected one of {sorted(ANOMALY_KINDS)}")
+        mix[kind] = int(count)
+    return mix
+
+def _random_text(rng, n):
+    lengths = rng.integers(2, 6, n)
+    chars = rng.choice(_TEXT_CHARS, (n, 5))
+    return np.array(["".join(row[:k]) for row, k in zip(chars, lengths)], dtype=object)
+
+def _clean_column(kind, rng, rows):
+    if kind == "int":
+        digits = int(rng.integers(4, 8))
+        return rng.integers(10 ** (digits - 1), 10 ** digits, rows)
+    if kind == "float":
+        return np.round(rng.normal(rng.uniform(100, 10000), rng.uniform(5, 500), rows), 2)
+    if kind == "date":
+        start = pd.Timestamp("2015-01-01").value
+        end = pd.Timestamp("2025-01-01").value
+        return pd.to_datetime(rng.integers(start, end, rows)).floor("s").to_numpy()
+    return rng.choice(CATEGORIES, rows)
+
+def _inject(kind, values, rows, rng):
+    # Through pandas, so datetime64 values become Timestamps rather than integers
+    column = pd.Series(values).to_numpy(dtype=object)
+    anomaly = rng.choice(ANOMALY_KINDS[kind], len(rows))
+    for name in ANOMALY_KINDS[kind]:
+        picked = rows[anomaly == name]
+        if name == "missing":
+            column[picked] = MISSING_VALUE
+        elif name == "text":
+            column[picked] = _random_text(rng, len(picked))
+        elif name == "length":
+            # One digit more than every clean value; stays within range of the column
+            column[picked] = values[picked] * 10 + rng.integers(0, 10, len(picked))
+        elif name == "range":
+            column[picked] = values[picked] * 1000
+    return column
+
+def make_sheet(rows, mix=None, anomaly_rate=DEFAULT_ANOMALY_RATE, seed=42):
+    """
+    Build a synthetic sheet and its ground truth.
+
+    Args:
+        rows (int): Number of data rows.
+        mix (dict, optional): Column kind ('int', 'float', 'date', 'category') -> count.
+            Defaults to DEFAULT_MIX.
+        anomaly_rate (float): Share of non-ID cells that are anomalous.
+        seed (int): Random seed; the same arguments always give the same sheet.
+
+    Returns:
+        tuple: (df, truth) where df is the sheet as written to Excel (ID column
+        first) and truth a bool matrix of df.shape, True for injected anomalies.
+    """
+    mix = DEFAULT_MIX if mix is None else mix
+    rng = np.random.default_rng(seed)
+    columns = {"ID": np.array([f"ID{i:07d}" for i in rng.permutation(rows)], dtype=object)}
+    truth = [np.zeros(rows, dtype=bool)]
+    for kind, count in mix.items():
+        for _ in range(count):
+            values = _clean_column(kind, rng, rows)
+            flagged = rng.random(rows) < anomaly_rate
+            columns[f"Variable{len(columns)}"] = _inject(kind, values, np.flatnonzero(flagged), rng) if flagged.any() else values
+            truth.append(flagged)
+    return pd.DataFrame(columns), np.column_stack(truth)
+
+def write_ground_truth(df, truth, output_file, chunk_rows=anamoly.WRITE_CHUNK_ROWS):
+    """
+    Write a sheet with its anomalous cells highlighted, as a labelled input file.
+    For a CSV, Parquet or Arrow path, the data is written as is and the truth
+    goes to its sidecar mask file (masks.mask_path).
+
+    Args:
+        df (pd.DataFrame): Sheet from make_sheet.
+        truth (np.ndarray): Bool matrix of df.shape.
+        output_file (str): Path of the workbook (or data file) to write.
+        chunk_rows (int): Number of rows converted per block.
+    """
+    if not readers.is_workbook(output_file):
+        readers.write_table(df, output_file)
+        masks.write_mask(truth, df.columns, masks.mask_path(output_file))
+        return
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(anamoly.OUTPUT_SHEET_NAME)
+    ws.append(list(df.columns))
+    fill = anamoly.highlight_fill()
+    for start in range(0, len(df), chunk_rows):
+        values = df.iloc[start:start + chunk_rows].to_numpy(dtype=object)
+        for row_values, row_truth in zip(values, truth[start:start + chunk_rows]):
+            row = list(row_values)
+            for i in np.flatnonzero(row_truth):
+                cell = WriteOnlyCell(ws, value=row[i])
+                cell.fill = fill
+                row[i] = cell
+            ws.append(row)
+    wb.save(output_file)
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic highlighted input workbook.")
+    parser.add_argument("output", help="workbook or data file to write, e.g. Synthetic.xlsx or Synthetic.parquet")
+    parser.add_argument("--rows", type=int, default=25000)
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help='e.g. "int=4,float=3,date=1,category=2"')
+    parser.add_argument("--anomaly-rate", type=float, default=DEFAULT_ANOMALY_RATE)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    df, truth = make_sheet(args.rows, args.mix, args.anomaly_rate, args.seed)
+    write_ground_truth(df, truth, args.output)
+    print(f"Wrote {args.output}: {len(df)} rows, {int(truth.sum())} highlighted cells.")
+
+if __name__ == "__main__":
+    main()
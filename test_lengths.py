@@ -0,0 +1,41 @@
+# test_lengths.py
+# The len_incon rule compares value lengths, so lengths.value_lengths must
+# match astype(str).str.len() exactly for every sample in lengths.sample_values,
+# with both float kernels (the Numba one only where numba is installed).
+#
+# Usage:
+#   python -m pytest -q test_lengths.py
+
+import numpy as np
+import pandas as pd
+import pytest
+import lengths
+
+SAMPLES = lengths.sample_values(20000)
+
+@pytest.fixture(params=["numpy", "numba"])
+def backend(request):
+    if request.param == "numba":
+        pytest.importorskip("numba")
+    return request.param
+
+@pytest.mark.parametrize("name", sorted(SAMPLES))
+def test_sample_lengths_match_str(name, backend):
+    mismatches = lengths.check_value_lengths(SAMPLES[name], backend)
+    assert mismatches.empty, mismatches.head().to_string()
+
+@pytest.mark.parametrize("value", [0.0, -0.0, 1e-4, 9.999999999999999e-05, 1e16, 9999999999999998.0,
+                                   0.1 + 0.2, 2.0 ** 53, 2.0 ** 53 - 1, 5e-324, np.inf, -np.inf])
+def test_special_float_lengths(value, backend):
+    assert lengths.float_lengths(np.array([value]), backend)[0] == len(str(value))
+
+def test_int64_limits():
+    values = pd.Series([np.iinfo(np.int64).min, np.iinfo(np.int64).max, 0, -1], dtype=np.int64)
+    assert lengths.check_value_lengths(values).empty
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float16])
+def test_narrow_floats_measured_as_printed(dtype, backend):
+    values = pd.Series([0.5, 0.1, 0.2, 0.3, 1.1], dtype=dtype)
+    assert lengths.check_value_lengths(values, backend).empty
+    with pytest.raises(TypeError):
+        lengths.float_lengths(values.to_numpy(), backend)
@@ -0,0 +1,90 @@
+# test_rules.py
+# Regression test for the vectorised rule engine: the original loop-based
+# rule_based_anomalies is kept here as a reference, and both must label every
+# cell of Train.xlsx and Test.xlsx identically.
+#
+# Usage:
+#   python -m pytest -q test_rules.py
+
+import os
+import pandas as pd
+import pytest
+import anamoly
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# pd.to_datetime warns when it falls back to dateutil on the text columns
+pytestmark = pytest.mark.filterwarnings("ignore::UserWarning")
+
+def reference_column_types(df, threshold=0.8):
+    # Original infer_column_types: every column parsed in full
+    types = {}
+    for col in df.columns:
+        col_data = df[col].dropna()
+        n = len(col_data)
+        if n == 0:
+            types[col] = 'unknown'
+            continue
+        num_valid = pd.to_numeric(col_data, errors='coerce').notnull().sum()
+        dt_valid = pd.to_datetime(col_data, errors='coerce').notnull().sum()
+        if num_valid / n >= threshold:
+            types[col] = 'numeric'
+        elif dt_valid / n >= threshold:
+            types[col] = 'datetime'
+        elif num_valid / n < (1 - threshold) and dt_valid / n < (1 - threshold):
+            types[col] = 'categorical'
+        else:
+            types[col] = 'mixed'
+    return types
+
+def reference_rule_based_anomalies(df, types):
+    # Original loop-based rule engine, returning label strings ('' if normal)
+    anomalies = pd.DataFrame('', index=df.index, columns=df.columns)
+    anomalies[df.isnull()] = 'missing'
+    for col in df.columns:
+        if types[col] == 'numeric':
+            coerced = pd.to_numeric(df[col], errors='coerce')
+            mask = df[col].notnull() & coerced.isnull()
+            anomalies.loc[mask, col] = 'type_mismatch'
+            valid_mask = (anomalies[col] == '')
+            valid_values = df.loc[valid_mask, col].astype(str)
+            lengths = valid_values.str.len()
+            if not lengths.empty:
+                mode_length = lengths.mode()[0]
+                mode_count = (lengths == mode_length).sum()
+                if mode_count / len(lengths) >= 0.85:
+                    for idx, val in valid_values.items():
+                        if len(val) != mode_length:
+                            anomalies.loc[idx, col] = 'len_incon'
+            q1 = coerced.quantile(0.08)
+            q3 = coerced.quantile(0.92)
+            iqr = q3 - q1
+            lower = q1 - 13 * iqr
+            upper = q3 + 13 * iqr
+            out_range = (coerced < lower) | (coerced > upper)
+            for idx in df.index:
+                if anomalies.loc[idx, col] == '' and out_range.loc[idx]:
+                    anomalies.loc[idx, col] = 'out_of_range'
+        elif types[col] == 'datetime':
+            coerced = pd.to_datetime(df[col], errors='coerce')
+            mask = df[col].notnull() & coerced.isnull()
+            anomalies.loc[mask, col] = 'type_mismatch'
+        elif types[col] == 'mixed':
+            mask = df[col].notnull()
+            anomalies.loc[mask, col] = 'type_mismatch'
+    return anomalies
+
+@pytest.fixture(scope="module", params=["Train.xlsx", "Test.xlsx"])
+def sheet(request):
+    path = os.path.join(HERE, request.param)
+    if not os.path.exists(path):
+        pytest.skip(f"{request.param} not found")
+    return pd.read_excel(path)
+
+def test_column_types_match_reference(sheet):
+    assert anamoly.infer_column_types(sheet) == reference_column_types(sheet)
+
+def test_rule_labels_match_reference(sheet):
+    types = reference_column_types(sheet)
+    expected = reference_rule_based_anomalies(sheet, types)
+    labels = anamoly.decode_labels(anamoly.rule_based_anomalies(sheet, types), sheet)
+    pd.testing.assert_frame_equal(labels, expected, check_dtype=False)
@@ -0,0 +1,103 @@
+# test_service.py
+# Worker-failure tests for the HTTP detection service: a worker killed while
+# requests are in flight must fail those requests with 503, replace only the
+# broken pool, and leave the service able to run new jobs.
+#
+# Usage:
+#   python -m pytest -q test_service.py
+
+import json
+import os
+import signal
+import threading
+import time
+import urllib.error
+import urllib.request
+import pytest
+import service
+
+# Seconds a test job runs; long enough to kill its worker mid-job
+JOB_SECONDS = 30
+
+def _slow_job(data, file_format, *args):
+    # Stands in for detect_job; finishes at once when the upload is b"fast"
+    if data != b"fast":
+        time.sleep(JOB_SECONDS)
+    return {"rows": 0}
+
+@pytest.fixture
+def server(monkeypatch, tmp_path):
+    # Workers are forked after the patch, so they run _slow_job as well
+    monkeypatch.setattr(service, "detect_job", _slow_job)
+    svc = service.DetectionService(workers=2, queue_size=0, model_dir=str(tmp_path), rules_only=True)
+    httpd = service.make_server(svc, port=0)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield svc, f"http://127.0.0.1:{httpd.server_address[1]}/detect"
+    httpd.shutdown()
+    svc.shutdown()
+
+def _post(url, data):
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=data), timeout=JOB_SECONDS) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as exc:
+        return exc.code, json.loads(exc.read())
+
+def _post_in_background(url, data, results):
+    thread = threading.Thread(target=lambda: results.append(_post(url, data)))
+    thread.start()
+    return thread
+
+def _wait_for_pending(svc, n):
+    deadline = time.monotonic() + 10
+    while svc.pending != n:
+        assert time.monotonic() < deadline, f"{svc.pending} pending jobs, expected {n}"
+        time.sleep(0.05)
+    # Give the workers time to pick the jobs up
+    time.sleep(0.5)
+
+def test_worker_killed_with_two_requests_in_flight(server, monkeypatch):
+    svc, url = server
+    broken = svc.pool
+    started = []
+    start_pool = svc._start_pool
+    monkeypatch.setattr(svc, "_start_pool", lambda: started.append(1) or start_pool())
+    results = []
+    threads = [_post_in_background(url, b"slow", results) for _ in range(2)]
+    _wait_for_pending(svc, 2)
+    os.kill(next(iter(broken._processes)), signal.SIGKILL)
+    for thread in threads:
+        thread.join()
+    assert [status for status, _ in results] == [503, 503]
+    # Both handlers restarted the same pool; it was replaced exactly once
+    assert svc.pool is not broken and len(started) == 1
+    replacement = svc.pool
+    assert svc.pending == 0
+    assert _post(url, b"fast") == (200, {"rows": 0})
+    assert svc.pool is replacement
+
+def test_restarting_a_replaced_pool_keeps_the_new_jobs(server):
+    svc, url = server
+    broken = svc.pool
+    svc.restart_pool(broken)
+    replacement = svc.pool
+    results = []
+    thread = _post_in_background(url, b"fast", results)
+    # A late handler whose job was on the old pool must not touch the new one
+    svc.restart_pool(broken)
+    thread.join()
+    assert results == [(200, {"rows": 0})]
+    assert svc.pool is replacement
+
+def test_failed_submit_frees_its_slot(server, monkeypatch):
+    svc, _ = server
+    def fail(*args):
+        raise RuntimeError("submit failed")
+    monkeypatch.setattr(svc.pool, "submit", fail)
+    assert svc.reserve()
+    with pytest.raises(RuntimeError):
+        svc.submit(_slow_job, b"fast", "xlsx")
+    assert svc.pending == 0
+    assert svc.reserve() and svc.reserve()
+    svc.release()
+    svc.release()
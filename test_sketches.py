@@ -0,0 +1,76 @@
+# test_sketches.py
+# Error-bound tests for the streaming summaries in sketches.py against the
+# exact in-memory implementations they stand in for.
+#
+# Usage:
+#   python -m pytest -q test_sketches.py
+
+import numpy as np
+import pandas as pd
+import pytest
+from sketches import LengthHistogram, QuantileSketch
+
+# Rank error allowed for a sketch of capacity k. KLL-style sketches guarantee
+# O(1/k); the merged sketches below stay under 2.5/k in practice.
+RANK_ERROR_FACTOR = 4
+
+def _rank(sorted_data, value):
+    return np.searchsorted(sorted_data, value) / len(sorted_data)
+
+def test_quantiles_exact_without_compaction():
+    data = np.random.default_rng(0).normal(size=1000)
+    sketch = QuantileSketch(k=4096)
+    sketch.update(data)
+    for q in (0, 0.08, 0.5, 0.92, 1):
+        assert sketch.quantile(q) == pytest.approx(np.quantile(data, q))
+
+@pytest.mark.parametrize("k", [128, 256, 1024])
+def test_merged_sketch_rank_error(k):
+    rng = np.random.default_rng(k)
+    data = rng.lognormal(0, 2, 200000)
+    merged = QuantileSketch(k, seed=1)
+    # Sketches of the chunks are built independently and merged, as in chunked.py
+    for seed, part in enumerate(np.array_split(data, 16), start=2):
+        sketch = QuantileSketch(k, seed=seed)
+        sketch.update(part)
+        merged.merge(sketch)
+    assert merged.count == len(data)
+    sorted_data = np.sort(data)
+    for q in np.linspace(0.01, 0.99, 99):
+        estimate = merged.quantile(q)
+        assert abs(_rank(sorted_data, estimate) - q) <= RANK_ERROR_FACTOR / k
+        assert abs(_rank(sorted_data, estimate) - _rank(sorted_data, np.quantile(data, q))) <= RANK_ERROR_FACTOR / k
+
+def test_merge_rejects_different_k():
+    with pytest.raises(ValueError):
+        QuantileSketch(64).merge(QuantileSketch(128))
+
+def test_empty_sketch_quantile_is_nan():
+    assert np.isnan(QuantileSketch().quantile(0.5))
+
+def test_length_histogram_matches_string_lengths():
+    rng = np.random.default_rng(0)
+    values = pd.Series(np.concatenate([
+        rng.integers(-10**6, 10**6, 3000),
+        np.round(rng.normal(0, 1000, 3000), 2),
+    ]).astype(object))
+    merged = LengthHistogram()
+    for part in np.array_split(values.to_numpy(), 7):
+        histogram = LengthHistogram()
+        histogram.update(pd.Series(part).astype(str).str.len().to_numpy())
+        merged.merge(histogram)
+    expected = values.astype(str).str.len().value_counts().sort_index()
+    pd.testing.assert_series_equal(merged.counts(), expected, check_names=False, check_index_type=False,
+                                   check_dtype=False)
+
+@pytest.mark.parametrize("dtype", [np.int64, np.float64, np.float32])
+def test_length_histogram_of_numeric_chunks(dtype):
+    # chunked.collect_stats measures numeric chunks with lengths.value_lengths
+    from lengths import value_lengths
+    values = pd.Series(np.round(np.random.default_rng(1).normal(0, 10**5, 5000), 1).astype(dtype))
+    histogram = LengthHistogram()
+    for part in np.array_split(np.arange(len(values)), 5):
+        histogram.update(value_lengths(values.iloc[part]).to_numpy())
+    expected = values.astype(str).str.len().value_counts().sort_index()
+    pd.testing.assert_series_equal(histogram.counts(), expected, check_names=False, check_index_type=False,
+                                   check_dtype=False)